@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import http.server
+import importlib
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+# Offline benchmark for the monitor. The pages in fixtures/ use the FI markup (search results
+# table and report detail pages) and are served from a local stand-in HTTP server, so no
+# network access is needed. Run `python benchmarks/bench.py --record` on a machine that can
+# reach marknadssok.fi.se to replace them with live pages under fixtures/recorded/.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+MIN_DELTA_MS = 0.05 # timing differences below this are noise, never a regression
+ROOT = os.path.join(HERE, os.pardir)
+
+
+def load_monitor():
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("finansinspektionen.monitor")
+
+
+def load_fixtures(directory):
+    search, detail = {}, {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(directory, name), 'r', encoding="utf-8") as f:
+            page = f.read()
+        (search if name.startswith("search") else detail)[name[:-5]] = page
+    return search, detail
+
+
+def start_server(search, detail):
+    search_pages = list(search.values())
+    detail_pages = list(detail.values())
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if "/Search/Search" in self.path:
+                page = int((re.search(r"Page=(\d+)", self.path) or [0, 1])[1])
+                body = search_pages[(page - 1) % len(search_pages)]
+            elif "/Index/" in self.path:
+                index = int(re.search(r"/Index/(\d+)", self.path)[1])
+                body = detail_pages[index % len(detail_pages)]
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def bench_search(monitor, search, repeat):
+    results = {}
+    rules = monitor.default_rules(500000)
+    engines = [name for name in monitor.MAINPAGE_PARSERS if name != "lxml" or monitor.lxml_available]
+    for i, (name, page) in enumerate(search.items()):
+        # the stand-in server answers Page=N with the N-th search fixture
+        url = monitor.SEARCH_URL.format(date_from="", date_to="", page=i + 1)
+        results[f"fetch/{name}"] = timed(lambda: monitor.poll_website(url), repeat)
+        for engine in engines:
+            monitor.mainpage_parser = engine
+            results[f"parse[{engine}]/{name}"] = timed(lambda: monitor.extract_rows(page), repeat)
+        rows = monitor.extract_rows(page)
+        results[f"filter/{name}"] = timed(lambda: monitor.filter_rows(rows, rules), repeat)
+    monitor.select_mainpage_parser()
+    return results
+
+
+def bench_detail(monitor, detail, base_url, repeat):
+    results = {}
+    for i, (name, page) in enumerate(detail.items()):
+        url = f"{base_url}/Publiceringsklient/en-GB/Search/Index/{i}"
+        results[f"fetch/{name}"] = timed(lambda: monitor.fetch_report(url), repeat)
+        results[f"parse/{name}"] = timed(lambda: monitor.parse_report(page), repeat)
+        transactions = monitor.parse_report(page)
+        results[f"render/{name}"] = timed(lambda: monitor.render_sentences(transactions), repeat)
+    return results
+
+
+def bench_throughput(monitor, detail, reports, max_workers):
+    # Full fetch + parse + render of a burst of reports through parse_new_reports
+    links = [f"/Publiceringsklient/en-GB/Search/Index/{i}?SearchFunctionType=Insyn" for i in range(reports)]
+    start = time.perf_counter()
+    monitor.parse_new_reports(links, max_workers)
+    elapsed = time.perf_counter() - start
+    # tracemalloc slows allocations down a lot, so memory is measured on a second run
+    tracemalloc.start()
+    monitor.parse_new_reports(links, max_workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        f"burst/{reports}x{max_workers}": {
+            "total_ms": elapsed * 1000,
+            "reports_per_s": reports / elapsed,
+            "peak_mem_kb": peak / 1024,
+        }
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Higher is better for reports_per_s, lower is better for everything else
+    regressions = 0
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if metric == "reports_per_s" else change
+            if metric.endswith("_ms") and abs(value - old) < MIN_DELTA_MS:
+                worse = 0
+            flag = "REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"{name:45} {metric:14} {old:12.3f} -> {value:12.3f} {change:+8.1%} {flag}")
+    return regressions
+
+
+def record(directory, reports):
+    monitor = load_monitor()
+    os.makedirs(directory, exist_ok=True)
+    page = monitor.poll_website(monitor.URL)
+    if not page:
+        sys.exit("Could not fetch the search page")
+    with open(os.path.join(directory, "search_page1.html"), 'w', encoding="utf-8") as f:
+        f.write(page)
+    links = [link for _, link in monitor.extract_rows(page) or [] if link]
+    for link in list(dict.fromkeys(links))[:reports]:
+        index = link.split("/Index/")[1].split("?")[0]
+        detail_page = monitor.fetch_report(f"{monitor.BASE_URL}{link}")
+        if detail_page:
+            with open(os.path.join(directory, f"detail_{index}.html"), 'w', encoding="utf-8") as f:
+                f.write(detail_page)
+    print(f"Recorded fixtures in {directory}")
+
+
+def print_results(results):
+    for name, metrics in results.items():
+        print(f"{name:45} " + "  ".join(f"{metric} {value:10.3f}" for metric, value in metrics.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Finansinspektionen monitor")
+    parser.add_argument("--fixtures", type=str, default=FIXTURES, help="Directory with search_*.html and detail_*.html pages")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per stage, the median and p95 are reported")
+    parser.add_argument("--reports", type=int, default=50, help="Reports in the burst used for the throughput run")
+    parser.add_argument("--max_workers", type=int, default=4, help="Concurrent detail fetches in the throughput run")
+    parser.add_argument("--save", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="JSON file from an earlier --save run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    parser.add_argument("--record", action="store_true", help="Fetch live pages from FI into fixtures/recorded and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record(os.path.join(FIXTURES, "recorded"), args.reports)
+        sys.exit(0)
+
+    monitor = load_monitor()
+    search, detail = load_fixtures(args.fixtures)
+    if not search or not detail:
+        sys.exit(f"No search_*.html / detail_*.html fixtures in {args.fixtures}")
+    server, base_url = start_server(search, detail)
+    monitor.SEARCH_URL = monitor.SEARCH_URL.replace(monitor.BASE_URL, base_url)
+    monitor.URL = monitor.URL.replace(monitor.BASE_URL, base_url)
+    monitor.BASE_URL = base_url
+    monitor.get_session().trust_env = False # never go through a proxy for the stand-in server
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()): # alerts and status lines
+        results.update(bench_search(monitor, search, args.repeat))
+        results.update(bench_detail(monitor, detail, base_url, args.repeat))
+        results.update(bench_throughput(monitor, detail, args.reports, args.max_workers))
+    server.shutdown()
+
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench import compare, print_results, timed
+
+# Cold start benchmark: every sample is a fresh interpreter. "preview" is the host platform's
+# registration / health check call, "stream" runs the command line setup up to the first poll
+# (imports, argument parsing, opening the stores and starting the output writer) and stops
+# there, "python" is the bare interpreter for reference.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, os.pardir))
+LAUNCHER = os.path.join(ROOT, "Finansinspektionen-2.py")
+
+STREAM = f"""
+import sys
+sys.path.insert(0, {ROOT!r})
+from finansinspektionen import cli, monitor
+monitor.run = lambda **kwargs: None
+cli.main(["--poll_interval", "60"])
+"""
+
+
+def commands():
+    return {
+        "python": [sys.executable, "-c", "pass"],
+        "preview": [sys.executable, LAUNCHER, "--preview"],
+        "stream": [sys.executable, "-c", STREAM],
+    }
+
+
+def check_preview():
+    # The shipped preview.json has to match preview(), else the fast path reports stale tags
+    sys.path.insert(0, ROOT)
+    from finansinspektionen import preview
+    shipped = subprocess.run(commands()["preview"], capture_output=True, text=True, check=True).stdout
+    if json.loads(shipped) != preview.preview():
+        sys.exit("preview.json is out of date, regenerate it with `python -m finansinspektionen.preview`")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start benchmark for the Finansinspektionen monitor")
+    parser.add_argument("--repeat", type=int, default=20, help="Interpreter starts per mode, the median and p95 are reported")
+    parser.add_argument("--save", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="JSON file from an earlier --save run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    check_preview()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory: # stream mode creates its stores in the working directory
+        for name, command in commands().items():
+            results[f"startup/{name}"] = timed(lambda: subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True), args.repeat)
+
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
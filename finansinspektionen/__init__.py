@@ -0,0 +1,2 @@
+# Finansinspektionen insider reports monitor, run with `python -m finansinspektionen` or
+# the Finansinspektionen-2.py launcher. The monitor itself is in finansinspektionen.monitor.
@@ -0,0 +1,175 @@
+import atexit
+import json
+import os
+import socket
+import sys
+
+from . import preview
+
+# The host platform runs the monitor with --preview on every registration and health check,
+# so that path only reads the shipped preview.json. The monitor module (and with it
+# argparse, sqlite3 and the HTTP stack) is imported for the other modes only.
+
+def build_parser():
+    import argparse
+    import datetime
+
+    from . import monitor
+
+    parser = argparse.ArgumentParser(description="Monitor Finansinspektionen Insider Reports")
+    parser.add_argument("--preview", action="store_true", help="Run the script in preview mode")
+    parser.add_argument("--threshold", type=str, help="Custom threshold, default is 500,000 (USD trades 50,000)")
+    parser.add_argument("--rules", type=str, help="JSON file with filter rules, replaces the default filter")
+    parser.add_argument("--poll_interval", type=int, default=60, help="Polling interval in seconds")
+    parser.add_argument("--min_interval", type=int, help="Shortest polling interval, used after new filings and in peak windows")
+    parser.add_argument("--max_interval", type=int, default=600, help="Longest polling interval when quiet or backing off from errors")
+    parser.add_argument("--peak_windows", type=str, default=monitor.PEAK_WINDOWS, help="Comma separated HH:MM-HH:MM windows (Stockholm time) polled at the shortest interval")
+    parser.add_argument("--max_workers", type=int, default=monitor.MAX_WORKERS, help="Number of report pages fetched concurrently")
+    parser.add_argument("--ordered", action="store_true", help="Emit alerts in publication order instead of completion order")
+    parser.add_argument("--incremental", action="store_true", help="Stop reading the search results at the newest report of the previous poll. --parser auto then picks the stream parser, the only one that also skips parsing the rest of the page")
+    parser.add_argument("--pipeline", action="store_true", help="Poll, fetch, parse and emit in separate asyncio stages so slow reports never delay the next poll")
+    parser.add_argument("--parse_workers", type=int, default=monitor.PARSE_WORKERS, help="Processes parsing report pages in --pipeline mode, 0 parses in threads")
+    parser.add_argument("--fast_alerts", action="store_true", help="Send alerts from the search rows right away and follow up with an update from the detail page")
+    parser.add_argument("--backfill", action="store_true", help="Process all search pages in the publication date range once and exit")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="First publication date to backfill, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="Last publication date to backfill, YYYY-MM-DD")
+    parser.add_argument("--fx_rates", type=str, default=monitor.FX_RATES_FILE, help="JSON file with SEK rates per currency used to compare values with the threshold")
+    parser.add_argument("--profiles", type=str, help="JSON file with named filter profiles, each with its own threshold, rules and outputs")
+    parser.add_argument("--templates", type=str, help="JSON file with sentence templates per language")
+    parser.add_argument("--language", type=str, default=monitor.TEMPLATE_LANGUAGE, help="Language of --templates to use")
+    parser.add_argument("--output", action="append", help="Where alerts go: stdout, file:PATH, tcp:HOST:PORT, unix:PATH or webhook:URL, repeat for several, default stdout")
+    parser.add_argument("--output_buffer", type=int, default=monitor.OUTPUT_BUFFER, help="Alerts buffered for the output writer before publishing blocks")
+    parser.add_argument("--output_batch", type=int, default=monitor.OUTPUT_BATCH, help="Alerts written to a sink in one batch")
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--json_log", action="store_true", help="Write one JSON line per poll cycle to stderr")
+    parser.add_argument("--seen_reports_db", type=str, default=monitor.SEEN_REPORTS_DB, help="SQLite file with already handled reports, ':memory:' to keep them in memory only")
+    parser.add_argument("--normalization", type=str, help="JSON file with extra position titles, legal form suffixes and issuer overrides")
+    parser.add_argument("--detail_cache", type=str, default=monitor.DETAIL_CACHE_DB, help="SQLite file caching report pages and parsed transactions, 'off' to disable")
+    parser.add_argument("--detail_cache_mb", type=int, default=monitor.DETAIL_CACHE_MAX_BYTES // (1024 * 1024), help="Size limit of the cached pages in MB")
+    parser.add_argument("--history", type=str, default=monitor.HISTORY_DIR, help="Directory of the columnar store every parsed transaction is added to, 'off' to disable")
+    parser.add_argument("--query", action="store_true", help="Query the history store and exit, filtered by --where, --min_value, --from and --to")
+    parser.add_argument("--where", action="append", default=[], help="COLUMN=VALUE filter for --query, repeat for several, e.g. position=CEO")
+    parser.add_argument("--min_value", type=float, help="Smallest value in SEK for --query")
+    parser.add_argument("--group_by", type=str, help="Aggregate --query results per value of this column, e.g. issuer")
+    parser.add_argument("--agg", choices=["sum", "net", "count"], default="sum", help="Aggregation for --group_by, net is acquisitions minus disposals")
+    parser.add_argument("--limit", type=int, help="Most rows printed by --query")
+    parser.add_argument("--ha", type=str, help="Run as one of several instances, only the holder of the lease polls: file:DIRECTORY on shared storage or redis://HOST:PORT/PREFIX")
+    parser.add_argument("--ha_ttl", type=float, help="Seconds a --ha lease lasts without renewal, default half the polling interval")
+    parser.add_argument("--parser", choices=["auto", *monitor.MAINPAGE_PARSERS], default="auto", help="Engine used to read the search results table")
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--preview"]:
+        sys.stdout.write(preview.preview_json())
+        return
+
+    from . import monitor
+
+    args = build_parser().parse_args(argv)
+    monitor.POOL_MAXSIZE = max(monitor.POOL_MAXSIZE, args.max_workers)
+    monitor.log(f"Using {monitor.select_mainpage_parser(args.parser, args.incremental)} parser for the search results")
+    if args.query:
+        store = monitor.HistoryStore(args.history)
+        filters = {}
+        for condition in args.where:
+            column, equals, value = condition.partition("=")
+            if not equals:
+                sys.exit(f"Error in query: --where {condition} is not COLUMN=VALUE")
+            filters[column] = value
+        filters.update(date_from=args.date_from and args.date_from.isoformat(), date_to=args.date_to and args.date_to.isoformat(), min_value=args.min_value)
+        try:
+            if args.group_by:
+                for group, total in store.aggregate(args.group_by, args.agg, **filters).items():
+                    print(json.dumps({args.group_by: group, args.agg: total}, ensure_ascii=False))
+            else:
+                for row in store.query(limit=args.limit, **filters):
+                    print(json.dumps(row, ensure_ascii=False))
+        except ValueError as e:
+            sys.exit(f"Error in query: {e}")
+        sys.exit(0)
+    monitor.seen_reports = monitor.SeenReportsStore(args.seen_reports_db)
+    monitor.templates = monitor.TemplateSet.load(args.templates, args.language) if args.templates else monitor.TemplateSet()
+    monitor.fast_alerts = args.fast_alerts
+    if args.history != "off":
+        monitor.history = monitor.HistoryStore(args.history)
+        atexit.register(monitor.history.flush)
+    if args.normalization:
+        monitor.normalizer = monitor.Normalizer.load(args.normalization)
+    if args.detail_cache != "off":
+        monitor.detail_cache = monitor.DetailCache(args.detail_cache, args.detail_cache_mb * 1024 * 1024)
+    monitor.fx_rates = monitor.FxTable(args.fx_rates)
+    monitor.fx_rates.start()
+    monitor.output = monitor.OutputWriter([monitor.make_sink(spec) for spec in args.output or ["stdout"]], args.output_buffer, args.output_batch)
+    monitor.output.start()
+    if args.metrics_port is not None:
+        monitor.start_metrics_server(args.metrics_port)
+    threshold = int(args.threshold) if isinstance(args.threshold, str) and args.threshold.isdigit() else 500000
+    rules = monitor.load_rules(args.rules, threshold) if args.rules else monitor.default_rules(threshold)
+    if args.profiles:
+        rules = monitor.load_profiles(args.profiles, threshold, rules, args.templates, args.language)
+        for profile in rules:
+            profile.output.start()
+        monitor.log(f"Monitoring {len(rules)} profiles: {', '.join(profile.name for profile in rules)}")
+    if args.backfill:
+        _, failed_pages, failed_reports = monitor.backfill(
+            threshold=threshold,
+            date_from=args.date_from.isoformat() if args.date_from else "",
+            date_to=args.date_to.isoformat() if args.date_to else "",
+            max_workers=max(1, args.max_workers),
+            ordered=args.ordered,
+            rules=rules,
+        )
+        sys.exit(1 if failed_pages or failed_reports else 0)
+    poll_interval = args.poll_interval if args.poll_interval and args.poll_interval > 0 else 60
+    scheduler = monitor.PollScheduler(poll_interval, args.min_interval, args.max_interval, args.peak_windows)
+    if args.ha:
+        holder = f"{socket.gethostname()}:{os.getpid()}"
+        monitor.ha = monitor.HighAvailability(monitor.make_coordinator(args.ha, holder), args.ha_ttl or max(3, poll_interval / 2))
+        atexit.register(monitor.ha.release)
+    try:
+        while True:
+            if monitor.ha is not None:
+                monitor.ha.wait_for_lease()
+            try:
+                poll(args, threshold, poll_interval, scheduler, rules)
+                break
+            except monitor.LeaseLost:
+                pass # another instance may be polling by now, stand by until the lease is free
+    except KeyboardInterrupt:
+        monitor.log("Polling interrupted by user.")
+
+def poll(args, threshold, poll_interval, scheduler, rules):
+    from . import monitor
+
+    if args.pipeline:
+        import asyncio
+        try:
+            asyncio.run(monitor.pipeline(
+                threshold=threshold,
+                poll_interval=poll_interval,
+                max_workers=max(1, args.max_workers),
+                parse_workers=max(0, args.parse_workers),
+                incremental=args.incremental,
+                scheduler=scheduler,
+                rules=rules,
+                json_log=args.json_log,
+            ))
+        except KeyboardInterrupt:
+            monitor.log("Polling interrupted by user.")
+        return
+    try:
+        monitor.run(
+            threshold=threshold,
+            poll_interval=poll_interval,
+            max_workers=max(1, args.max_workers),
+            ordered=args.ordered,
+            incremental=args.incremental,
+            scheduler=scheduler,
+            rules=rules,
+            json_log=args.json_log,
+        )
+    except monitor.LeaseLost:
+        raise
+    except Exception as e:
+        monitor.log(f"Error running the script: {e}")
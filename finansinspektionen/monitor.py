@@ -0,0 +1,2826 @@
+import array
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import dataclasses
+import re
+import datetime
+import functools
+import hashlib
+import html.parser
+import importlib.util
+import json
+import os
+import sqlite3
+import string
+import time
+import zlib
+import threading
+import zoneinfo
+import atexit
+import queue
+import socket
+import sys
+
+from .preview import BASE_URL, DEFAULT_TEMPLATES, SEARCH_URL, TEMPLATE_LANGUAGE, URL, preview
+
+# requests, bs4, lxml and numpy are imported where they are first used, so --preview and
+# tools importing the package don't pay for the HTTP and HTML stack
+lxml_available = importlib.util.find_spec("lxml") is not None
+
+try:
+    STOCKHOLM_TZ = zoneinfo.ZoneInfo("Europe/Stockholm")
+except zoneinfo.ZoneInfoNotFoundError:
+    STOCKHOLM_TZ = None # no tz database, fall back to local time
+
+
+SEEN_REPORTS_FILE = "seen_reports.json" # legacy format, imported into the database once
+SEEN_REPORTS_DB = "seen_reports.db"
+SEEN_REPORTS_MAX = 100_000
+SEEN_REPORTS_TTL = 90 * 24 * 3600 # seconds
+DETAIL_CACHE_DB = "detail_cache.db"
+DETAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024 # compressed pages
+DETAIL_CACHE_VERSION = 3 # bump when parse_report output changes, cached pages are then parsed again
+HISTORY_DIR = "history"
+HISTORY_FLUSH_ROWS = 500 # transactions buffered before they are written to the history store
+# History column -> array typecode, "str" columns are dictionary encoded
+HISTORY_COLUMNS = {
+    "report_index": "str",
+    "transaction_date": "i", # YYYYMMDD, 0 when the report had no readable date
+    "issuer": "str",
+    "obligated_name": "str",
+    "managerial_person": "str",
+    "position": "str",
+    "instrument": "str",
+    "transaction": "str",
+    "currency": "str",
+    "volume": "d",
+    "total_value": "d",
+    "total_value_base": "d",
+    "closely_associated": "b",
+    "recorded_at": "d",
+}
+MAX_WORKERS = 4 # concurrent detail page fetches
+POOL_MAXSIZE = 10 # keep-alive connections kept open to marknadssok.fi.se
+RESULTS_TABLE_MARKER = 'table table-bordered table-hover table-striped zero-margin-top'
+PAGE_UNCHANGED = object() # returned by poll_website when the results table did not change
+BACKFILL_MAX_PAGES = 500
+BACKFILL_RETRIES = 5 # extra attempts for a search page that failed, backing off 1, 2, 4, ... seconds or as long as Retry-After asks
+BASE_CURRENCY = "SEK" # thresholds and *_base values are in this currency
+FX_RATES_FILE = "fx_rates.json"
+FX_REFRESH_INTERVAL = 3600 # seconds between checks of the FX rates file
+PEAK_WINDOWS = "07:55-09:15,17:25-18:30" # Stockholm time, weekdays
+BUSINESS_HOURS = "07:00-19:00"
+ACTIVE_CYCLES = 3 # polls kept at the short interval after new filings showed up
+PIPELINE_QUEUE_SIZE = 100 # reports waiting between two stages of --pipeline
+PARSE_WORKERS = min(4, os.cpu_count() or 1) # processes parsing detail pages in --pipeline
+REPORT_STATE_MAX = 10_000 # reports remembered in report_status, report_rows and the like
+
+class LRUDict(collections.OrderedDict):
+    # Keeps the max_size most recently set entries, the oldest is dropped first
+    def __init__(self, max_size=REPORT_STATE_MAX):
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:139.0) Gecko/20100101 Firefox/139.0",
+}
+
+class SeenReportsStore:
+    # Set-like store of handled report links backed by SQLite, so it survives restarts and
+    # crashes mid-write (WAL journal). Lookups hit the database index, nothing is loaded up
+    # front. Entries older than ttl seconds are dropped and at most max_entries are kept.
+    def __init__(self, path=SEEN_REPORTS_DB, max_entries=SEEN_REPORTS_MAX, ttl=SEEN_REPORTS_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen_reports (report TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS seen_reports_seen_at ON seen_reports (seen_at)")
+        self.import_json(SEEN_REPORTS_FILE)
+
+    def import_json(self, path):
+        # one-off migration of the old JSON file
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                self.update(json.load(f))
+            os.replace(path, f"{path}.imported")
+        except Exception as e:
+            log(f"Error loading seen reports: {e}")
+
+    def __contains__(self, report):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM seen_reports WHERE report = ? AND seen_at >= ?", (report, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM seen_reports").fetchone()[0]
+
+    def add(self, report):
+        self.update([report])
+
+    def update(self, reports):
+        now = time.time()
+        entries = [(report, now) for report in reports if report]
+        self.merge(entries)
+        if ha is not None:
+            ha.replicate_seen(entries)
+
+    def merge(self, entries):
+        # (report, seen_at) pairs, also from the leader's journal on a standby
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO seen_reports (report, seen_at) VALUES (?, ?) ON CONFLICT (report) DO UPDATE SET seen_at = max(seen_at, excluded.seen_at)",
+                    entries,
+                )
+                self.evict(time.time())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def entries(self):
+        with self.lock:
+            return self.conn.execute("SELECT report, seen_at FROM seen_reports ORDER BY seen_at").fetchall()
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM seen_reports WHERE seen_at < ?", (now - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM seen_reports WHERE rowid IN (SELECT rowid FROM seen_reports ORDER BY seen_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+seen_reports = set() # replaced by a SeenReportsStore when run from the command line
+
+HA_LEASE_TTL = 30 # seconds a lease lasts without renewal, standbys try to take it every third of that
+HA_JOURNAL_MAX = 10_000 # replicated entries kept before the leader compacts them into a snapshot
+
+class LeaseLost(Exception):
+    pass
+
+class FileCoordinator:
+    # Lease and replicated state in a directory on shared storage. The lease is an exclusive
+    # POSIX lock on leader.lock (fcntl.lockf, which NFS hands to the server), dropped by the OS
+    # when the leader dies; a leader that hangs without dying keeps it. The leader appends state
+    # to journal.<generation>.jsonl and now and then folds everything into snapshot.json under
+    # the next generation.
+    def __init__(self, directory, holder):
+        self.directory = directory
+        self.holder = holder
+        self.lock_file = None
+        self.generation = None # generation and byte offset read so far
+        self.offset = 0
+        self.entries = 0 # entries in the journal of the current generation
+        self.tail_checked = False # a dead leader can leave a partial last line behind
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, ttl):
+        import fcntl
+        if self.lock_file is None:
+            self.lock_file = open(os.path.join(self.directory, "leader.lock"), 'a+')
+        try:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        self.lock_file.truncate(0)
+        self.lock_file.write(f"{self.holder}\n")
+        self.lock_file.flush()
+        self.tail_checked = False
+        return True
+
+    def renew(self, ttl):
+        return self.lock_file is not None # held until the file is closed
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close() # closing drops the lock
+            self.lock_file = None
+
+    def journal_path(self, generation):
+        return os.path.join(self.directory, f"journal.{generation}.jsonl")
+
+    def read(self):
+        # (snapshot or None, [entries]) written since the previous read
+        snapshot = None
+        try:
+            with open(os.path.join(self.directory, "snapshot.json"), 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {"generation": 0}
+        if stored["generation"] != self.generation:
+            snapshot = stored if stored["generation"] else None
+            self.generation, self.offset, self.entries = stored["generation"], 0, 0
+        entries = []
+        try:
+            with open(self.journal_path(self.generation), 'rb') as f:
+                f.seek(self.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # still being written
+                    self.offset += len(line)
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        log(f"Skipping an unreadable journal entry at byte {self.offset - len(line)}")
+        except FileNotFoundError:
+            pass # compacted since the snapshot was read, picked up on the next read
+        self.entries += len(entries)
+        return snapshot, entries
+
+    def append(self, entry):
+        path = self.journal_path(self.generation or 0)
+        if not self.tail_checked:
+            # cut off the partial line of a leader that died mid-write, or our entry would be glued onto it
+            with contextlib.suppress(FileNotFoundError), open(path, 'rb+') as f:
+                f.seek(self.offset)
+                tail = f.read()
+                if not tail.endswith(b"\n"):
+                    f.truncate(self.offset + tail.rfind(b"\n") + 1)
+            self.tail_checked = True
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += 1
+
+    def compact(self, state):
+        old = self.journal_path(self.generation or 0)
+        self.generation = (self.generation or 0) + 1
+        path = os.path.join(self.directory, "snapshot.json")
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({"generation": self.generation, **state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        if os.path.exists(old):
+            os.remove(old)
+        self.offset, self.entries = 0, 0
+
+class RedisCoordinator:
+    # Lease and replicated state on a Redis-compatible server (Redis, Valkey, KeyDB, ...),
+    # spoken to in RESP over a plain socket. The lease is a key set with NX and a TTL, renewed
+    # and compacted from Lua scripts that first check the caller still holds it.
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    READ = (
+        "local generation = redis.call('get', KEYS[2]) or '0' local offset = tonumber(ARGV[2]) local snapshot = false "
+        "if generation ~= ARGV[1] then offset = 0 snapshot = redis.call('get', KEYS[3]) or false end "
+        "return {generation, snapshot, redis.call('lrange', KEYS[4], offset, -1)}"
+    )
+    COMPACT = (
+        "if redis.call('get', KEYS[1]) ~= ARGV[1] then return 0 end "
+        "local generation = redis.call('incr', KEYS[2]) redis.call('set', KEYS[3], ARGV[2]) redis.call('del', KEYS[4]) "
+        "return generation"
+    )
+
+    def __init__(self, url, holder):
+        # redis://HOST:PORT/PREFIX, the prefix (default "finansinspektionen") namespaces the keys
+        address, _, prefix = url.removeprefix("redis://").partition("/")
+        host, _, port = address.partition(":")
+        self.address = (host or "127.0.0.1", int(port or 6379))
+        self.keys = [f"{prefix or 'finansinspektionen'}:{name}" for name in ("leader", "generation", "snapshot", "journal")]
+        self.holder = holder
+        self.connection = None
+        self.lock = threading.Lock() # one connection, shared with the heartbeat thread
+        self.generation = None
+        self.offset = 0
+        self.entries = 0
+
+    def command(self, *args):
+        request = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            arg = str(arg).encode("utf-8")
+            request.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        with self.lock:
+            if self.connection is None:
+                self.connection = socket.create_connection(self.address, timeout=10).makefile('rwb')
+            try:
+                self.connection.write(b"".join(request))
+                self.connection.flush()
+                return self.reply()
+            except OSError:
+                self.connection.close()
+                self.connection = None
+                raise
+
+    def reply(self):
+        line = self.connection.readline()
+        if not line:
+            raise ConnectionError("connection closed by the server")
+        kind, value = line[:1], line[1:-2]
+        if kind == b"+":
+            return value.decode()
+        if kind == b"-":
+            raise RuntimeError(value.decode())
+        if kind == b":":
+            return int(value)
+        if kind == b"$":
+            if int(value) < 0:
+                return None
+            data = self.connection.read(int(value) + 2)[:-2]
+            return data.decode("utf-8")
+        if kind == b"*":
+            return None if int(value) < 0 else [self.reply() for _ in range(int(value))]
+        raise RuntimeError(f"Unexpected reply {line!r}")
+
+    def acquire(self, ttl):
+        return self.command("SET", self.keys[0], self.holder, "NX", "PX", int(ttl * 1000)) == "OK"
+
+    def renew(self, ttl):
+        return self.command("EVAL", self.RENEW, 1, self.keys[0], self.holder, int(ttl * 1000)) == 1
+
+    def release(self):
+        try:
+            self.command("EVAL", self.RELEASE, 1, self.keys[0], self.holder)
+        except (OSError, RuntimeError):
+            pass # the lease runs out on its own
+
+    def read(self):
+        generation, snapshot, entries = self.command("EVAL", self.READ, 4, *self.keys, self.generation, self.offset)
+        if generation != self.generation:
+            self.generation, self.offset, self.entries = generation, 0, 0
+        self.offset += len(entries)
+        self.entries += len(entries)
+        return json.loads(snapshot) if snapshot else None, [json.loads(entry) for entry in entries]
+
+    def append(self, entry):
+        self.entries = self.command("RPUSH", self.keys[3], json.dumps(entry))
+
+    def compact(self, state):
+        generation = self.command("EVAL", self.COMPACT, 4, *self.keys, self.holder, json.dumps(state))
+        if generation:
+            self.generation, self.offset, self.entries = str(generation), 0, 0
+
+def make_coordinator(spec, holder):
+    # "file:DIRECTORY" or "redis://HOST:PORT/PREFIX"
+    kind, _, target = spec.partition(":")
+    if kind == "file" and target:
+        return FileCoordinator(target, holder)
+    if kind == "redis":
+        return RedisCoordinator(spec, holder)
+    raise ValueError(f"Unknown --ha {spec!r}, use file:DIRECTORY or redis://HOST:PORT/PREFIX")
+
+class HighAvailability:
+    # Active/standby: only the instance holding the lease polls FI. The leader journals every
+    # report it adds to seen_reports and every new high-water mark; standbys apply the journal
+    # as it grows, so on takeover they start from the leader's state instead of alerting on
+    # the whole search page again. Reports are only marked seen once the output writers have
+    # handed their alerts to the sinks (drain_outputs), an alert still buffered when the leader
+    # dies is sent by the new one. --fast_alerts preliminary alerts are journaled after a
+    # drain too, so the new leader follows them up with an "update" instead of a second alert.
+    def __init__(self, coordinator, ttl=HA_LEASE_TTL):
+        self.coordinator = coordinator
+        self.ttl = ttl
+        self.lease_until = 0 # monotonic time the lease is known to last until
+        self.term = 0 # bumped on every takeover, ends the heartbeat of the previous one
+        self.replicated_mark = None
+        self.lock = threading.Lock()
+        metrics.gauge_function("fi_ha_leader", lambda: int(self.leading))
+
+    @property
+    def leading(self):
+        return time.monotonic() < self.lease_until
+
+    def wait_for_lease(self):
+        log(f"Standing by for the lease as {self.coordinator.holder}")
+        while True:
+            try:
+                self.catch_up()
+                acquired_at = time.monotonic()
+                if self.coordinator.acquire(self.ttl):
+                    try:
+                        self.catch_up() # whatever the previous leader wrote after our last read
+                        break
+                    except (OSError, RuntimeError, ValueError):
+                        self.coordinator.release() # cannot lead without the previous leader's state
+                        raise
+            except (OSError, RuntimeError, ValueError) as e:
+                log(f"Error reaching the HA coordinator: {e}")
+            time.sleep(self.ttl / 3)
+        self.replicated_mark = high_water_mark
+        self.lease_until = acquired_at + self.ttl
+        self.term += 1
+        metrics.inc("fi_ha_takeovers_total")
+        log(f"Took over the lease, {len(seen_reports)} seen reports, high-water mark {high_water_mark}")
+        threading.Thread(target=self.heartbeat, args=(self.term,), name="ha-heartbeat", daemon=True).start()
+
+    def heartbeat(self, term):
+        while self.leading and term == self.term:
+            time.sleep(self.ttl / 3)
+            renewed_at = time.monotonic()
+            try:
+                renewed = self.coordinator.renew(self.ttl)
+            except (OSError, RuntimeError) as e:
+                log(f"Error renewing the lease: {e}")
+                continue # still leading until lease_until
+            if term != self.term:
+                break
+            if not renewed:
+                self.lease_until = 0
+                log("Lost the lease to another instance")
+                break
+            self.lease_until = renewed_at + self.ttl
+
+    def check(self):
+        # Called before every poll, a leader without a valid lease must not poll or alert
+        if not self.leading:
+            log("Lease expired, stepping down to standby")
+            raise LeaseLost()
+
+    def catch_up(self):
+        global high_water_mark
+        snapshot, entries = self.coordinator.read()
+        for entry in ([snapshot] if snapshot else []) + entries:
+            preliminary_alerts.update(entry.get("preliminary") or {})
+            if entry.get("seen"):
+                seen_reports.merge(entry["seen"])
+                for report, _ in entry["seen"]:
+                    preliminary_alerts.pop(report, None) # the leader sent its update
+            if "high_water_mark" in entry:
+                high_water_mark = entry["high_water_mark"]
+
+    def replicate_seen(self, entries):
+        if self.leading and entries:
+            self.append({"seen": entries})
+
+    def replicate_preliminary(self, report, output_sentences):
+        if self.leading:
+            drain_outputs()
+            self.append({"preliminary": {report: output_sentences}})
+
+    def replicate_high_water_mark(self, link):
+        if self.leading and link != self.replicated_mark:
+            self.replicated_mark = link
+            self.append({"high_water_mark": link})
+
+    def append(self, entry):
+        with self.lock:
+            self.coordinator.append(entry)
+            metrics.inc("fi_ha_journal_entries_total")
+            if self.coordinator.entries > HA_JOURNAL_MAX:
+                self.coordinator.compact({"seen": seen_reports.entries(), "preliminary": dict(preliminary_alerts), "high_water_mark": high_water_mark})
+
+    def release(self):
+        self.lease_until = 0
+        self.coordinator.release()
+
+ha = None # HighAvailability from --ha when run from the command line
+
+class DetailCache:
+    # On-disk cache of report detail pages and their parsed transaction records, keyed by
+    # report index. Pages are stored compressed under their content hash, so an amendment
+    # that serves the same page again reuses the stored copy. An entry is dropped when the
+    # search row shows another status than when it was cached, and the least recently used
+    # reports are evicted once the stored pages exceed max_bytes.
+    def __init__(self, path=DETAIL_CACHE_DB, max_bytes=DETAIL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages (hash TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports (report_index TEXT PRIMARY KEY, status TEXT, hash TEXT NOT NULL, "
+            "records TEXT, version INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS reports_accessed ON reports (accessed)")
+
+    def get(self, report_index, status=None):
+        # (page, records) or None; records is None when they were parsed by another DETAIL_CACHE_VERSION
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT r.status, r.records, r.version, p.body FROM reports r JOIN pages p ON p.hash = r.hash WHERE r.report_index = ?",
+                (report_index,),
+            ).fetchone()
+            if row is None:
+                metrics.inc("fi_detail_cache_total", result="miss")
+                return None
+            cached_status, records, version, body = row
+            if status is not None and cached_status is not None and status != cached_status:
+                self.conn.execute("DELETE FROM reports WHERE report_index = ?", (report_index,))
+                metrics.inc("fi_detail_cache_total", result="invalidated")
+                return None
+            self.conn.execute("UPDATE reports SET accessed = ? WHERE report_index = ?", (time.time(), report_index))
+        metrics.inc("fi_detail_cache_total", result="hit")
+        return zlib.decompress(body).decode("utf-8"), json.loads(records) if records and version == DETAIL_CACHE_VERSION else None
+
+    def put(self, report_index, status, page, records):
+        body = zlib.compress(page.encode("utf-8"))
+        page_hash = hashlib.blake2b(body, digest_size=16).hexdigest()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT OR IGNORE INTO pages (hash, body, size) VALUES (?, ?, ?)", (page_hash, body, len(body)))
+                self.conn.execute(
+                    "INSERT INTO reports (report_index, status, hash, records, version, accessed) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (report_index) DO UPDATE SET status = COALESCE(excluded.status, reports.status), "
+                    "hash = excluded.hash, records = excluded.records, version = excluded.version, accessed = excluded.accessed",
+                    (report_index, status, page_hash, json.dumps(records), DETAIL_CACHE_VERSION, time.time()),
+                )
+                self.evict()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def evict(self):
+        self.conn.execute("DELETE FROM pages WHERE hash NOT IN (SELECT hash FROM reports)")
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        dropped = []
+        for report_index, size in self.conn.execute(
+            "SELECT r.report_index, p.size FROM reports r JOIN pages p ON p.hash = r.hash ORDER BY r.accessed"
+        ).fetchall():
+            if total <= self.max_bytes * 0.9: # leave some room so not every put evicts
+                break
+            dropped.append((report_index,))
+            total -= size
+        self.conn.executemany("DELETE FROM reports WHERE report_index = ?", dropped)
+        self.conn.execute("DELETE FROM pages WHERE hash NOT IN (SELECT hash FROM reports)")
+        metrics.inc("fi_detail_cache_evicted_total", len(dropped))
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+detail_cache = None # DetailCache from --detail_cache when run from the command line
+report_status = LRUDict() # report link -> status column of its search row, checked against the detail cache
+
+@functools.cache
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None # history queries fall back to plain Python loops
+    return numpy
+
+class HistoryStore:
+    # Columnar store of every parsed transaction, one directory per transaction month
+    # (history/month=2026-10/) with one binary file per column. Numbers are raw arrays, text
+    # columns hold int32 codes into a per-partition dictionary (<column>.dict.json). Columns
+    # are only ever appended to, a partly written batch is cut off at the shortest column
+    # when the store is opened, so later appends stay row aligned. columns.json lists the
+    # columns a partition was written with, columns added since are filled with empty values.
+    # Queries read the columns they need and filter with numpy when it is installed.
+    def __init__(self, root=HISTORY_DIR, flush_rows=HISTORY_FLUSH_ROWS):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.pending = [] # (report index, rows) not yet on disk
+        self.pending_rows = 0
+        self.dictionaries = {} # (partition, column) -> (values, value -> code)
+        os.makedirs(root, exist_ok=True)
+        self.reports_path = os.path.join(root, "reports.txt")
+        try:
+            with open(self.reports_path, 'r', encoding="utf-8") as f:
+                self.reports = set(f.read().split())
+        except FileNotFoundError:
+            self.reports = set()
+        self.repair()
+
+    def repair(self):
+        # A crash in write_pending can leave some columns of a partition longer than others
+        for partition in self.partitions():
+            directory = os.path.join(self.root, partition)
+            try:
+                with open(os.path.join(directory, "columns.json"), 'r', encoding="utf-8") as f:
+                    written = [column for column in json.load(f) if column in HISTORY_COLUMNS]
+            except FileNotFoundError:
+                # written before columns.json, its column files are its schema
+                written = [column for column in HISTORY_COLUMNS if os.path.exists(os.path.join(directory, f"{column}.bin"))]
+            sizes = {}
+            for column in written:
+                path = os.path.join(directory, f"{column}.bin")
+                itemsize = array.array("i" if HISTORY_COLUMNS[column] == "str" else HISTORY_COLUMNS[column]).itemsize
+                sizes[path] = (os.path.getsize(path) if os.path.exists(path) else 0, itemsize)
+            rows = min((size // itemsize for size, itemsize in sizes.values()), default=0)
+            for path, (size, itemsize) in sizes.items():
+                if size > rows * itemsize:
+                    log(f"Truncating {path} to {rows} rows after an incomplete write")
+                    os.truncate(path, rows * itemsize)
+            added = [column for column in HISTORY_COLUMNS if column not in written]
+            for column in added:
+                kind = HISTORY_COLUMNS[column]
+                log(f"Adding column {column} to {partition}, {rows} rows")
+                values = self.encode(partition, column, [""] * rows) if kind == "str" else [0] * rows
+                with open(os.path.join(directory, f"{column}.bin"), 'wb') as f:
+                    array.array("i" if kind == "str" else kind, values).tofile(f)
+            if added or not os.path.exists(os.path.join(directory, "columns.json")):
+                self.write_columns(directory)
+
+    def write_columns(self, directory):
+        path = os.path.join(directory, "columns.json")
+        with open(f"{path}.tmp", 'w', encoding="utf-8") as f:
+            json.dump(list(HISTORY_COLUMNS), f)
+        os.replace(f"{path}.tmp", path)
+
+    def append(self, report_index, transaction_results):
+        # Reports are stored once, replays and cache hits of a stored report are skipped
+        with self.lock:
+            if report_index in self.reports or not transaction_results:
+                return
+            self.reports.add(report_index)
+            now = time.time()
+            self.pending.append((report_index, [history_row(report_index, result, now) for result in transaction_results]))
+            self.pending_rows += len(transaction_results)
+            if self.pending_rows >= self.flush_rows:
+                self.write_pending()
+
+    def flush(self):
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        if not self.pending:
+            return
+        partitions = {}
+        for _, rows in self.pending:
+            for row in rows:
+                day = row["transaction_date"]
+                partitions.setdefault(f"month={day // 10000:04d}-{day // 100 % 100:02d}" if day else "month=unknown", []).append(row)
+        for partition, rows in partitions.items():
+            directory = os.path.join(self.root, partition)
+            os.makedirs(directory, exist_ok=True)
+            if not os.path.exists(os.path.join(directory, "columns.json")):
+                self.write_columns(directory)
+            for column, kind in HISTORY_COLUMNS.items():
+                values = [row[column] for row in rows]
+                if kind == "str":
+                    values = self.encode(partition, column, values)
+                with open(os.path.join(directory, f"{column}.bin"), 'ab') as f:
+                    array.array("i" if kind == "str" else kind, values).tofile(f)
+        # reports are listed once their rows are on disk
+        with open(self.reports_path, 'a', encoding="utf-8") as f:
+            f.write("".join(f"{report_index}\n" for report_index, _ in self.pending))
+        metrics.inc("fi_history_rows_total", self.pending_rows)
+        self.pending = []
+        self.pending_rows = 0
+
+    def dictionary(self, partition, column):
+        key = (partition, column)
+        if key not in self.dictionaries:
+            try:
+                with open(os.path.join(self.root, partition, f"{column}.dict.json"), 'r', encoding="utf-8") as f:
+                    values = json.load(f)
+            except FileNotFoundError:
+                values = []
+            self.dictionaries[key] = (values, {value: code for code, value in enumerate(values)})
+        return self.dictionaries[key]
+
+    def encode(self, partition, column, values):
+        dictionary, codes = self.dictionary(partition, column)
+        size = len(dictionary)
+        for value in values:
+            if value not in codes:
+                codes[value] = len(dictionary)
+                dictionary.append(value)
+        if len(dictionary) != size:
+            path = os.path.join(self.root, partition, f"{column}.dict.json")
+            with open(f"{path}.tmp", 'w', encoding="utf-8") as f:
+                json.dump(dictionary, f, ensure_ascii=False)
+            os.replace(f"{path}.tmp", path)
+        return [codes[value] for value in values]
+
+    def partitions(self, date_from=None, date_to=None):
+        months = sorted(name for name in os.listdir(self.root) if name.startswith("month="))
+        first = f"month={date_from[:7]}" if date_from else ""
+        last = f"month={date_to[:7]}" if date_to else "month=~"
+        return [name for name in months if first <= name <= last]
+
+    def read_column(self, partition, column):
+        typecode = "i" if HISTORY_COLUMNS[column] == "str" else HISTORY_COLUMNS[column]
+        path = os.path.join(self.root, partition, f"{column}.bin")
+        numpy = load_numpy()
+        if numpy is not None:
+            return numpy.fromfile(path, dtype=numpy.dtype(typecode)) if os.path.exists(path) else numpy.zeros(0, typecode)
+        values = array.array(typecode)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            values.frombytes(data[: len(data) - len(data) % values.itemsize])
+        return values
+
+    def scan(self, columns, date_from=None, date_to=None, min_value=None, **filters):
+        # Yields (partition, {column: values of the matching rows}) with text columns still as codes
+        numpy = load_numpy()
+        date_from = date_from.replace("-", "") if date_from else ""
+        date_to = date_to.replace("-", "") if date_to else ""
+        unknown = (set(columns) | set(filters)) - set(HISTORY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}, use {', '.join(HISTORY_COLUMNS)}")
+        self.flush()
+        needed = set(columns) | set(filters) | {"transaction_date"} | ({"total_value_base"} if min_value is not None else set())
+        for partition in self.partitions(date_from and f"{date_from[:4]}-{date_from[4:6]}", date_to and f"{date_to[:4]}-{date_to[4:6]}"):
+            data = {column: self.read_column(partition, column) for column in needed}
+            rows = min(len(values) for values in data.values())
+            data = {column: values[:rows] for column, values in data.items()}
+            conditions = []
+            if date_from:
+                conditions.append((data["transaction_date"], lambda day, bound=int(date_from): day >= bound))
+            if date_to:
+                conditions.append((data["transaction_date"], lambda day, bound=int(date_to): day <= bound))
+            if min_value is not None:
+                conditions.append((data["total_value_base"], lambda value, bound=float(min_value): value >= bound))
+            for column, wanted in filters.items():
+                wanted = {str(value).upper() for value in (wanted if isinstance(wanted, (list, tuple, set)) else [wanted])}
+                if HISTORY_COLUMNS[column] == "str":
+                    codes = [code for code, value in enumerate(self.dictionary(partition, column)[0]) if value.upper() in wanted]
+                    if numpy is not None:
+                        conditions.append((data[column], lambda values, codes=codes: numpy.isin(values, codes)))
+                    else:
+                        codes = set(codes)
+                        conditions.append((data[column], lambda value, codes=codes: value in codes))
+                else:
+                    numbers = {float(value) for value in wanted}
+                    conditions.append((data[column], lambda value, numbers=numbers: value in numbers if numpy is None else numpy.isin(value, list(numbers))))
+            if numpy is not None:
+                mask = numpy.ones(rows, dtype=bool)
+                for values, condition in conditions:
+                    mask &= condition(values)
+                yield partition, {column: data[column][mask] for column in columns}
+            else:
+                keep = [i for i in range(rows) if all(condition(values[i]) for values, condition in conditions)]
+                yield partition, {column: [data[column][i] for i in keep] for column in columns}
+
+    def decode(self, partition, column, values):
+        if HISTORY_COLUMNS[column] != "str":
+            return [value.item() if hasattr(value, "item") else value for value in values]
+        dictionary = self.dictionary(partition, column)[0]
+        return [dictionary[code] for code in values]
+
+    def query(self, columns=None, limit=None, **filters):
+        # Matching rows as dicts, e.g. query(position="CEO", transaction="Disposal", min_value=5_000_000,
+        # date_from="2026-07-01", date_to="2026-09-30")
+        columns = list(columns or HISTORY_COLUMNS)
+        results = []
+        for partition, data in self.scan(columns, **filters):
+            decoded = [self.decode(partition, column, data[column]) for column in columns]
+            results.extend(dict(zip(columns, row)) for row in zip(*decoded))
+            if limit and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    def aggregate(self, group_by="issuer", agg="sum", value="total_value_base", **filters):
+        # {group: sum / net (acquisitions minus disposals) / count}, largest first
+        if agg not in ("sum", "net", "count"):
+            raise ValueError(f"Unknown aggregation {agg}, use sum, net or count")
+        numpy = load_numpy()
+        totals = {}
+        columns = [group_by, value] + (["transaction"] if agg == "net" else [])
+        for partition, data in self.scan(columns, **filters):
+            groups = self.dictionary(partition, group_by)[0] if HISTORY_COLUMNS[group_by] == "str" else None
+            if agg == "count":
+                weights = None
+            elif agg == "net":
+                transactions = self.dictionary(partition, "transaction")[0]
+                signs = [1.0 if name.upper() == "ACQUISITION" else -1.0 if name.upper() == "DISPOSAL" else 0.0 for name in transactions]
+                if numpy is not None:
+                    weights = numpy.asarray(data[value], dtype=float) * numpy.asarray(signs or [0.0])[data["transaction"]]
+                else:
+                    weights = [amount * signs[code] for amount, code in zip(data[value], data["transaction"])]
+            else:
+                weights = data[value]
+            if numpy is not None and groups is not None:
+                sums = numpy.bincount(data[group_by], weights=weights, minlength=len(groups))
+                for code in numpy.flatnonzero(numpy.bincount(data[group_by], minlength=len(groups))):
+                    totals[groups[code]] = totals.get(groups[code], 0) + sums[code].item()
+            else:
+                keys = self.decode(partition, group_by, data[group_by])
+                for i, key in enumerate(keys):
+                    totals[key] = totals.get(key, 0) + (1 if weights is None else float(weights[i]))
+        if agg == "count":
+            totals = {key: int(total) for key, total in totals.items()}
+        return dict(sorted(totals.items(), key=lambda item: abs(item[1]), reverse=True))
+
+def history_row(report_index, result, recorded_at):
+    try:
+        volume = float(result["volume"])
+    except ValueError:
+        volume = 0.0
+    day = result.get("transaction_date") or ""
+    return {
+        "report_index": report_index,
+        "transaction_date": int(day.replace("-", "")) if day else 0,
+        "issuer": result["issuer_clean"],
+        "obligated_name": result["obligated_clean_name"],
+        "managerial_person": result["managerial_person"],
+        "position": result.get("position", ""),
+        "instrument": result["clean_instrument"],
+        "transaction": result["transaction"],
+        "currency": result["currency"],
+        "volume": volume,
+        "total_value": float(result["total_value"]),
+        "total_value_base": float(result["total_value_base"]),
+        "closely_associated": 1 if result["isClose"] else 0,
+        "recorded_at": recorded_at,
+    }
+
+history = None # HistoryStore from --history when run from the command line
+
+last_poll = {"status": None, "retry_after": None} # outcome of the latest poll_website call
+
+# name -> (type, help) of everything exposed on the metrics endpoint
+METRICS = {
+    "fi_cycle_seconds": ("histogram", "Time spent in one poll cycle, sleeping excluded"),
+    "fi_poll_seconds": ("histogram", "Time to fetch the search page"),
+    "fi_parse_mainpage_seconds": ("histogram", "Time to read and filter the search results table"),
+    "fi_parse_new_reports_seconds": ("histogram", "Time to fetch, parse and emit the new reports of a cycle"),
+    "fi_report_fetch_seconds": ("histogram", "Time to fetch one report detail page"),
+    "fi_publication_to_alert_seconds": ("histogram", "Time from FI publication to the alert being emitted"),
+    "fi_http_responses_total": ("counter", "HTTP responses from FI by status code"),
+    "fi_http_retries_total": ("counter", "Retried requests to FI"),
+    "fi_http_errors_total": ("counter", "Requests to FI that failed without a response"),
+    "fi_rows_scanned_total": ("counter", "Search result rows read"),
+    "fi_rows_qualified_total": ("counter", "Search result rows that matched a filter rule"),
+    "fi_reports_processed_total": ("counter", "Report detail pages processed"),
+    "fi_alerts_total": ("counter", "Reports that produced an alert"),
+    "fi_preliminary_alerts_total": ("counter", "Alerts sent from the search rows before the detail page was fetched"),
+    "fi_alert_updates_total": ("counter", "Preliminary alerts followed up with the detail page"),
+    "fi_profile_alerts_total": ("counter", "Alerts by profile"),
+    "fi_cycles_total": ("counter", "Poll cycles by outcome"),
+    "fi_output_events_total": ("counter", "Alerts published to the output writer"),
+    "fi_output_batches_total": ("counter", "Batches handed to the output sinks"),
+    "fi_output_errors_total": ("counter", "Failed batch writes by sink"),
+    "fi_output_buffer_full_total": ("counter", "Alerts that had to wait for room in the output buffer"),
+    "fi_output_blocked_seconds": ("histogram", "Time publishing an alert waited on a full output buffer"),
+    "fi_output_write_seconds": ("histogram", "Time to write one batch to one sink"),
+    "fi_output_queue_depth": ("gauge", "Alerts waiting in the output buffer"),
+    "fi_detail_cache_total": ("counter", "Detail cache lookups by result: hit, miss or invalidated by a status change"),
+    "fi_detail_cache_evicted_total": ("counter", "Reports evicted from the detail cache"),
+    "fi_detail_cache_bytes": ("gauge", "Compressed pages held in the detail cache"),
+    "fi_pipeline_queue_depth": ("gauge", "Reports waiting for a --pipeline stage"),
+    "fi_normalizer_cache_hit_ratio": ("gauge", "Share of issuer, name and position lookups answered from the normalizer cache"),
+    "fi_history_rows_total": ("counter", "Transactions written to the history store"),
+    "fi_seen_reports": ("gauge", "Reports in the seen reports store"),
+    "fi_poll_interval_seconds": ("gauge", "Current polling interval"),
+    "fi_next_poll_seconds": ("gauge", "Time left until the next poll"),
+    "fi_ha_leader": ("gauge", "1 while this instance holds the --ha lease and polls"),
+    "fi_ha_takeovers_total": ("counter", "Times this instance took over the --ha lease"),
+    "fi_ha_journal_entries_total": ("counter", "Seen reports and high-water mark updates replicated to standbys"),
+}
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600)
+PUBLICATION_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+
+class Metrics:
+    # Thread safe counters, gauges and histograms, rendered in the Prometheus text format
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {} # (name, labels) -> value
+        self.histograms = {} # name -> [bucket counts, sum, count]
+        self.gauge_functions = {} # name -> function called when rendering
+        self.published = LRUDict() # report link -> publication timestamp, until the alert goes out
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value):
+        with self.lock:
+            buckets, total, count = self.histograms.get(name) or ([0] * len(HISTOGRAM_BUCKETS), 0.0, 0)
+            index = bisect.bisect_left(HISTOGRAM_BUCKETS, value)
+            if index < len(buckets):
+                buckets[index] += 1
+            self.histograms[name] = [buckets, total + value, count + 1]
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def gauge_function(self, name, function):
+        self.gauge_functions[name] = function
+
+    def value(self, name, **labels):
+        with self.lock:
+            return self.values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def record_publication(self, report_link, published):
+        for fmt in PUBLICATION_FORMATS:
+            try:
+                timestamp = datetime.datetime.strptime(published, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return
+        timestamp = timestamp.replace(tzinfo=STOCKHOLM_TZ) if STOCKHOLM_TZ else timestamp
+        with self.lock:
+            if report_link not in self.published:
+                self.published[report_link] = timestamp.timestamp()
+
+    def alert_sent(self, report_link):
+        with self.lock:
+            published = self.published.pop(report_link, None)
+        if published is not None:
+            self.observe("fi_publication_to_alert_seconds", max(0.0, time.time() - published))
+
+    def render(self):
+        for name, function in self.gauge_functions.items():
+            try:
+                self.set(name, function())
+            except Exception:
+                pass
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    buckets, total, count = self.histograms.get(name) or ([0] * len(HISTOGRAM_BUCKETS), 0.0, 0)
+                    cumulative = 0
+                    for bound, bucket in zip(HISTOGRAM_BUCKETS, buckets):
+                        cumulative += bucket
+                        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+                    lines.append(f"{name}_sum {total}")
+                    lines.append(f"{name}_count {count}")
+                    continue
+                for (value_name, labels), value in sorted(self.values.items()):
+                    if value_name == name:
+                        label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def start_metrics_server(port, host="127.0.0.1"):
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def log(message):
+    # Diagnostics go to stderr, stdout is reserved for the alerts
+    print(message, file=sys.stderr, flush=True)
+
+def log_cycle(**fields):
+    # One JSON line per poll cycle on stderr
+    log(json.dumps({"ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), **fields}))
+
+session = None
+session_lock = threading.Lock()
+page_validators = {} # url -> ETag / Last-Modified / hash of the results table from the previous poll
+retry_after_hints = {} # url -> Retry-After seconds of its latest response, last_poll is shared by concurrent backfill fetches
+
+def get_session():
+    global session
+    import requests
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(POOL_MAXSIZE, MAX_WORKERS))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        import email.utils
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0, int((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()))
+    except (TypeError, ValueError):
+        return None
+
+def results_table_hash(page):
+    # Hash only the results table, the rest of the page carries tokens that change on every request
+    start = page.find(RESULTS_TABLE_MARKER)
+    end = page.find("</table>", start) if start != -1 else -1
+    if start != -1 and end != -1:
+        page = page[start:end]
+    return hashlib.blake2b(page.encode("utf-8", "replace"), digest_size=16).hexdigest()
+
+def poll_website(url, max_retries=3, conditional=False):
+    import requests
+    validators = page_validators.get(url, {}) if conditional else {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    for attempt in range(max_retries):
+        try:
+            with metrics.timer("fi_poll_seconds"):
+                response = get_session().get(url, headers=headers, timeout=30)
+            metrics.inc("fi_http_responses_total", status=response.status_code)
+            last_poll["status"] = response.status_code
+            last_poll["retry_after"] = retry_after_hints[url] = retry_after_seconds(response.headers.get("Retry-After"))
+
+            if response.status_code == 304 and conditional:
+                return PAGE_UNCHANGED
+            if response.status_code == 200:
+                if not conditional:
+                    return response.text
+                page_hash = results_table_hash(response.text)
+                unchanged = page_hash == validators.get("hash")
+                page_validators[url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "hash": page_hash,
+                }
+                return PAGE_UNCHANGED if unchanged else response.text
+            else:
+                log(f"Attempt {attempt + 1}: Received status code {response.status_code}")
+                return ""  # Always return a string 
+                
+        except requests.RequestException as e:
+            metrics.inc("fi_http_errors_total")
+            last_poll["status"] = None
+            last_poll["retry_after"] = retry_after_hints[url] = None
+            log(f"Error fetching website: {e}")
+
+        if attempt < max_retries - 1:
+            wait_time = 2 ** attempt  # 1, 2, 4, 8, etc. seconds
+            metrics.inc("fi_http_retries_total")
+            log(f"Retrying in {wait_time} seconds...")
+            time.sleep(wait_time)
+    
+    log("All attempts to fetch website failed.")
+    return None
+
+class StopParsing(Exception):
+    pass
+
+class ResultsTableParser(html.parser.HTMLParser):
+    # Streams through the search page and only keeps the text of the results table cells,
+    # no tree is built for the rest of the page.
+    def __init__(self, stop_at=None):
+        super().__init__()
+        self.stop_at = stop_at
+        self.found = False
+        self.rows = []
+        self.table_depth = 0
+        self.tbody_done = False
+        self.in_tbody = False
+        self.row = None
+        self.cell = None
+        self.link = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self.table_depth:
+                self.table_depth += 1
+            elif not self.found and dict(attrs).get("class") == RESULTS_TABLE_MARKER:
+                self.found = True
+                self.table_depth = 1
+            return
+        if self.table_depth != 1:
+            return
+        if tag == "tbody" and not self.tbody_done:
+            self.in_tbody = True
+        elif not self.in_tbody:
+            return
+        elif tag == "tr":
+            self.close_row()
+            self.row = []
+        elif tag == "td" and self.row is not None:
+            self.close_cell()
+            self.cell = []
+        elif tag == "a" and self.cell is not None and len(self.row) == 15 and self.link is None:
+            self.link = dict(attrs).get("href")
+            if self.stop_at and self.link == self.stop_at:
+                # everything from here on was handled in an earlier poll
+                self.row = None
+                raise StopParsing()
+
+    def handle_endtag(self, tag):
+        if not self.table_depth:
+            return
+        if tag == "table":
+            self.table_depth -= 1
+            if not self.table_depth:
+                self.close_row()
+                self.in_tbody = False
+            return
+        if self.table_depth != 1 or not self.in_tbody:
+            return
+        if tag == "td":
+            self.close_cell()
+        elif tag == "tr":
+            self.close_row()
+        elif tag == "tbody":
+            self.close_row()
+            self.in_tbody = False
+            self.tbody_done = True
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def close_cell(self):
+        if self.cell is not None:
+            self.row.append("".join(self.cell).strip())
+            self.cell = None
+
+    def close_row(self):
+        self.close_cell()
+        if self.row is not None:
+            self.rows.append((self.row, self.link))
+            self.row = None
+            self.link = None
+
+def extract_rows_stream(main_page, stop_at=None):
+    parser = ResultsTableParser(stop_at)
+    try:
+        parser.feed(main_page)
+        parser.close()
+    except StopParsing:
+        pass
+    return parser.rows if parser.found else None
+
+def extract_rows_lxml(main_page, stop_at=None):
+    # builds the tree of the whole page, stop_at only ends the row loop early
+    import lxml.html
+    tree = lxml.html.fromstring(main_page)
+    tables = tree.xpath(f"//table[@class='{RESULTS_TABLE_MARKER}']")
+    if not tables:
+        return None
+    tbody = tables[0].find(".//tbody")
+    if tbody is None:
+        return []
+    rows = []
+    for row in tbody.iter("tr"):
+        cells = row.xpath(".//td")
+        links = cells[15].xpath(".//a[@href]") if len(cells) >= 16 else []
+        report_link = links[0].get("href") if links else None
+        if stop_at and report_link == stop_at:
+            break
+        rows.append(([cell.text_content().strip() for cell in cells], report_link))
+    return rows
+
+def extract_rows_bs4(main_page, stop_at=None):
+    import bs4
+    soup = bs4.BeautifulSoup(main_page, "html.parser")
+    table = soup.find("table", {"class": RESULTS_TABLE_MARKER})
+    if not table:
+        return None
+    tbody = table.find("tbody")
+    if not tbody:
+        return []
+    rows = []
+    for row in tbody.find_all("tr"):
+        cells = row.find_all("td")
+        details_link = cells[15].find("a", href=True) if len(cells) >= 16 else None
+        report_link = details_link["href"] if details_link else None
+        if stop_at and report_link == stop_at:
+            break
+        rows.append(([cell.text.strip() for cell in cells], report_link))
+    return rows
+
+MAINPAGE_PARSERS = {
+    "lxml": extract_rows_lxml,
+    "stream": extract_rows_stream,
+    "bs4": extract_rows_bs4,
+}
+mainpage_parser = "lxml" if lxml_available else "stream"
+
+def select_mainpage_parser(name="auto", incremental=False):
+    # auto: lxml reads a whole page fastest, but incremental polls usually stop after a few
+    # rows and the stream parser stops reading the page right there
+    global mainpage_parser
+    if name == "auto":
+        name = "lxml" if lxml_available and not incremental else "stream"
+    elif name == "lxml" and not lxml_available:
+        log("lxml is not installed, falling back to the stream parser")
+        name = "stream"
+    mainpage_parser = name
+    return name
+
+def extract_rows(main_page, stop_at=None):
+    try:
+        rows = MAINPAGE_PARSERS[mainpage_parser](main_page, stop_at)
+    except Exception as e:
+        log(f"Error in {mainpage_parser} parser: {e}")
+        rows = None
+    if rows is None and mainpage_parser != "bs4":
+        rows = extract_rows_bs4(main_page, stop_at)
+    return rows
+
+# Newest report link seen on the search page. Results are sorted newest first, so in
+# incremental mode rows are only read until this link shows up again.
+high_water_mark = None
+newest_report_link = None
+
+def parse_mainpage(main_page, rules, incremental=False):
+    global newest_report_link
+    with metrics.timer("fi_parse_mainpage_seconds"):
+        rows = extract_rows(main_page, high_water_mark if incremental else None)
+        
+        if rows is None:
+            log("Warning: Could not find the table with reports")
+            return []  # Always return a list
+
+        newest_report_link = next((report_link for _, report_link in rows if report_link), high_water_mark)
+        return filter_rows(rows, rules)
+
+RULE_KEYS = {
+    "name", "instrument_types", "transactions", "currencies", "min_value", "currency_min_values",
+    "issuers", "issuer_pattern", "persons", "person_pattern", "closely_associated", "closely_associated_surnames",
+}
+
+def default_rule_config(threshold):
+    # The filter the monitor has always applied, plus the USD 50,000 threshold from the old TODO
+    return [{
+        "name": "default",
+        "instrument_types": ["Share"],
+        "transactions": ["Acquisition", "Disposal"],
+        "min_value": threshold,
+        "currency_min_values": {"USD": 50_000},
+        "closely_associated": "exclude",
+        "closely_associated_surnames": ["Arnhult", "Persson"],
+    }]
+
+def load_rules(path, threshold):
+    # JSON file: {"rules": [{"name": ..., <RULE_KEYS>}, ...]}, rules without min_value use --threshold
+    with open(path, 'r', encoding="utf-8") as f:
+        config = json.load(f)
+    return build_rules(config["rules"] if isinstance(config, dict) else config, threshold)
+
+def build_rules(rules, threshold):
+    rules = [dict(rule) for rule in rules]
+    for rule in rules:
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in rule {rule.get('name')}: {', '.join(sorted(unknown))}")
+        rule.setdefault("min_value", threshold)
+    return RuleMatcher(rules)
+
+@functools.lru_cache(maxsize=None)
+def default_rules(threshold):
+    return RuleMatcher(default_rule_config(threshold))
+
+class RuleMatcher:
+    # Compiles the rules into one bitmask per column value (bit i = rule i accepts the value),
+    # so a row is matched with a handful of dict lookups and ANDs however many rules there
+    # are. Thresholds are resolved with a bisect over the sorted rule thresholds, and the
+    # issuer / person patterns are only run once per distinct name thanks to the caches.
+    # The first rule (in file order) that accepts the row is reported.
+    def __init__(self, rules):
+        self.names = [rule.get("name") or f"rule {i + 1}" for i, rule in enumerate(rules)]
+        self.all_rules = (1 << len(rules)) - 1
+        self.instrument_types = self.value_index(rules, "instrument_types")
+        self.transactions = self.value_index(rules, "transactions")
+        self.currencies = self.value_index(rules, "currencies")
+        self.issuer_mask = self.name_matcher(rules, "issuers", "issuer_pattern")
+        self.person_mask = self.name_matcher(rules, "persons", "person_pattern")
+
+        self.not_closely_associated = 0
+        self.closely_associated = 0
+        self.closely_associated_surnames = {}
+        for i, rule in enumerate(rules):
+            mode = rule.get("closely_associated", "exclude")
+            if mode not in ("exclude", "include", "only"):
+                raise ValueError(f"closely_associated must be exclude, include or only in rule {self.names[i]}")
+            if mode != "only":
+                self.not_closely_associated |= 1 << i
+            if mode != "exclude":
+                self.closely_associated |= 1 << i
+            for surname in rule.get("closely_associated_surnames") or []:
+                key = surname.casefold()
+                self.closely_associated_surnames[key] = self.closely_associated_surnames.get(key, 0) | 1 << i
+
+        # min_value is in BASE_CURRENCY and compared with the converted value, a currency_min_values
+        # entry is in that currency and compared with the traded value
+        currencies = {currency for rule in rules for currency in (rule.get("currency_min_values") or {})}
+        self.thresholds = {}
+        for currency in currencies:
+            overrides = [(rule.get("currency_min_values") or {}).get(currency) for rule in rules]
+            self.thresholds[currency] = (
+                self.threshold_table([(i, value) for i, value in enumerate(overrides) if value is not None]),
+                self.threshold_table([(i, rule.get("min_value", 0)) for i, rule in enumerate(rules) if overrides[i] is None]),
+            )
+        self.default_thresholds = (self.threshold_table([]), self.threshold_table([(i, rule.get("min_value", 0)) for i, rule in enumerate(rules)]))
+
+    def value_index(self, rules, key):
+        index, wildcard = {}, 0
+        for i, rule in enumerate(rules):
+            if rule.get(key) is None:
+                wildcard |= 1 << i
+            else:
+                for value in rule[key]:
+                    index[value] = index.get(value, 0) | 1 << i
+        return index, wildcard
+
+    def name_matcher(self, rules, names_key, pattern_key):
+        exact, wildcard, patterns = {}, 0, []
+        for i, rule in enumerate(rules):
+            if rule.get(names_key) is None and rule.get(pattern_key) is None:
+                wildcard |= 1 << i
+            for name in rule.get(names_key) or []:
+                exact[name.casefold()] = exact.get(name.casefold(), 0) | 1 << i
+            if rule.get(pattern_key):
+                patterns.append((re.compile(rule[pattern_key], re.IGNORECASE), 1 << i))
+
+        @functools.lru_cache(maxsize=4096)
+        def mask(name):
+            result = wildcard | exact.get(name.casefold(), 0)
+            for pattern, bit in patterns:
+                if pattern.search(name):
+                    result |= bit
+            return result
+        return mask
+
+    def threshold_table(self, thresholds):
+        # sorted thresholds plus prefix masks: rules with threshold < value are prefix[bisect_left(...)]
+        ordered = sorted((float(threshold), i) for i, threshold in thresholds)
+        prefix = [0]
+        for _, i in ordered:
+            prefix.append(prefix[-1] | 1 << i)
+        return [threshold for threshold, _ in ordered], prefix
+
+    def lookup(self, index, value):
+        values, wildcard = index
+        return values.get(value, 0) | wildcard
+
+    def match(self, cells, total_value, base_value=None):
+        mask = (
+            self.all_rules
+            & self.lookup(self.instrument_types, cells[7])
+            & self.lookup(self.transactions, cells[5])
+            & self.lookup(self.currencies, cells[13])
+        )
+        if not mask:
+            return None
+
+        if cells[4] == "":
+            mask &= self.not_closely_associated
+        else:
+            names = cells[2].split(" ")
+            surnames = self.closely_associated_surnames.get(names[-1].casefold(), 0)
+            if len(names) > 1:
+                surnames |= self.closely_associated_surnames.get(names[-2].casefold(), 0)
+            mask &= self.closely_associated | surnames
+
+        (native, native_prefix), (base, base_prefix) = self.thresholds.get(cells[13], self.default_thresholds)
+        base_value = total_value if base_value is None else base_value
+        mask &= native_prefix[bisect.bisect_left(native, total_value)] | base_prefix[bisect.bisect_left(base, base_value)]
+        if mask:
+            mask &= self.issuer_mask(cells[1]) & self.person_mask(cells[2])
+        if not mask:
+            return None
+        return self.names[(mask & -mask).bit_length() - 1]
+
+def filter_rows(rows, rules):
+    # rules is a threshold, a RuleMatcher or a list of Profiles. With profiles every row is
+    # valued once and checked against each profile, and the result maps each qualifying
+    # report to the profiles it matched.
+    profiles = rules if isinstance(rules, list) else None
+    if profiles is None and not isinstance(rules, RuleMatcher):
+        rules = default_rules(rules)
+    to_process = {} # report -> matched profiles, keeps the page order, newest first
+    qualified = 0
+    grouped = {}
+    if fast_alerts:
+        for cells, report_link in rows:
+            grouped.setdefault(report_link, []).append(cells)
+    
+    for cells, report_link in rows:
+        # Check if we have enough cells
+        if len(cells) >= 16:
+            # publication_date = cells[0] # publication date
+            # issuer = cells[1]  # This gets "Promimic AB"
+            # person = cells[2]
+            # position = cells[3]  # "Chief Financial Officer (CFO)"
+            # closely_associated = cells[4]
+            # transaction_nature = cells[5]
+            # instrument_name = cells[6]  # "Promimic AB" (again)
+            # instrument_type = cells[7]
+            # isin = cells[8]  # ISIN code
+            # transaction_date = cells[9]
+            volume = cells[10]  # Transaction volume
+            # unit = cells[11]  # Unit (e.g., "Quantity")
+            price = cells[12]  # Price per unit
+            # currency = cells[13]  # "SEK"
+            # status = cells[14] 
+
+            # Calculate total value
+            try:
+                volume_float = float(volume.replace(",", "").strip())
+                price_float = float(price.replace(",", "").strip())
+                total_value = volume_float * price_float
+            except ValueError:
+                total_value = 0.0
+            
+            base_value = fx_rates.to_base(total_value, cells[13])
+            if profiles is None:
+                matches = [(None, rules.match(cells, total_value, base_value))]
+            else:
+                matches = [(profile, profile.rules.match(cells, total_value, base_value)) for profile in profiles]
+            qualified += any(rule for _, rule in matches)
+            for profile, rule in matches:
+                if not rule:
+                    continue
+                if report_link not in to_process:
+                    metrics.record_publication(report_link, cells[0])
+                    report_status[report_link] = cells[14]
+                    if fast_alerts:
+                        report_rows[report_link] = grouped[report_link]
+                    to_process[report_link] = []
+                if profile is None:
+                    if not to_process[report_link]:
+                        log(f"Report {report_link} matched rule '{rule}'")
+                        to_process[report_link].append(profile)
+                elif profile not in to_process[report_link]:
+                    log(f"Report {report_link} matched rule '{rule}' of profile '{profile.name}'")
+                    to_process[report_link].append(profile)
+
+    metrics.inc("fi_rows_scanned_total", len(rows))
+    metrics.inc("fi_rows_qualified_total", qualified)
+    return to_process if profiles is not None else list(to_process)
+
+class FxTable:
+    # Conversion rates into BASE_CURRENCY read from a local JSON file such as
+    # {"base": "SEK", "rates": {"EUR": 11.2, "USD": 10.5, "NOK": 0.98}} (BASE_CURRENCY per unit).
+    # The table lives in memory and a background thread re-reads the file when it changes, so
+    # converting a row is a single dict lookup. Unknown currencies are left unconverted.
+    def __init__(self, path=None, refresh_interval=FX_REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.rates = {BASE_CURRENCY: 1.0}
+        self.mtime = None
+        self.missing = set()
+        self.stop_event = threading.Event()
+        if path:
+            self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self.mtime is None:
+                log(f"No FX rates file at {self.path}, values are compared unconverted")
+                self.mtime = 0
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                config = json.load(f)
+            if config.get("base", BASE_CURRENCY).upper() != BASE_CURRENCY:
+                raise ValueError(f"rates must be quoted in {BASE_CURRENCY}")
+            rates = {currency.upper(): float(rate) for currency, rate in config["rates"].items()}
+            rates[BASE_CURRENCY] = 1.0
+            self.rates = rates # swapped in one go, readers never see a half loaded table
+            self.mtime = mtime
+            log(f"Loaded {len(rates)} FX rates from {self.path}")
+        except Exception as e:
+            log(f"Error loading FX rates: {e}")
+
+    def start(self):
+        if self.path and self.refresh_interval:
+            threading.Thread(target=self.refresh_loop, name="fx-refresh", daemon=True).start()
+
+    def refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            self.reload()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def to_base(self, value, currency):
+        rate = self.rates.get(currency.upper() if currency else BASE_CURRENCY)
+        if rate is None:
+            if currency not in self.missing:
+                self.missing.add(currency)
+                log(f"No FX rate for {currency}, comparing its values unconverted")
+            return value
+        return value * rate
+
+fx_rates = FxTable() # replaced by the table loaded from --fx_rates when run from the command line
+
+def format_total_value(total_value):
+    # format total_value as e.g. 12.3 MLN
+    if total_value >= 1_000_000_000:
+        return f"{total_value/1_000_000_000:.1f} BLN"
+    elif total_value >= 1_000_000:
+        return f"{total_value/1_000_000:.1f} MLN"
+    elif total_value >= 1_000:
+        return f"{total_value:,.0f}"
+    else:
+        return f"{total_value:.0f}"
+
+def parse_new_reports(to_process, max_workers=MAX_WORKERS, ordered=False, routes=None):
+    # Fetch and parse the detail pages concurrently; results are emitted from this thread
+    # so the alerts of different reports never interleave. routes maps a report to the
+    # profiles that get its alert, see filter_rows; each page is still fetched only once.
+    to_process = list(to_process)
+    processed_reports = []
+    if not to_process:
+        return processed_reports
+
+    if fast_alerts:
+        for report in reversed(to_process) if ordered else to_process:
+            try:
+                emit_preliminary(report, routes.get(report) if isinstance(routes, dict) else None)
+            except Exception as e:
+                log(f"Error sending the preliminary alert for {report}: {e}")
+
+    with metrics.timer("fi_parse_new_reports_seconds"), concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_process)))) as executor:
+        futures = {executor.submit(process_report, report): report for report in to_process}
+        if ordered:
+            # search results are listed newest first, publication order is the reverse
+            completed = reversed(list(futures))
+        else:
+            completed = concurrent.futures.as_completed(futures)
+
+        for future in completed:
+            report = futures[future]
+            try:
+                result = future.result()
+                if result is None:
+                    continue
+                finish_report(report, *result, profiles=routes.get(report) if isinstance(routes, dict) else None)
+            except Exception as e:
+                log(f"Error processing report {report}: {e}")
+                continue
+            processed_reports.append(report)
+
+    if history:
+        history.flush()
+    return processed_reports
+
+OUTPUT_BUFFER = 1000 # alerts held for the output writer before publishing blocks
+OUTPUT_BATCH = 50 # alerts handed to a sink in one write
+OUTPUT_FLUSH_INTERVAL = 0.5 # seconds a partial batch waits for more alerts
+OUTPUT_RETRIES = 3
+OUTPUT_FLUSH = object() # put in the buffer to have a partial batch delivered right away
+
+@dataclasses.dataclass
+class AlertEvent:
+    report_url: str
+    report_index: str
+    output_sentences: list
+    profile: str = None # name of the profile the alert is for, None without --profiles
+    emitted_at: str = dataclasses.field(default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"))
+    type: str = "alert" # "update" replaces the sentences of an earlier preliminary alert for the same report_url
+    preliminary: bool = False # rendered from the search rows, the detail page is still to come
+    share_option: bool = None # a transaction is part of a share option programme, None until the detail page is in
+
+    def to_json(self):
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False)
+
+class StreamSink:
+    # NDJSON to an open text file, or to whatever sys.stdout is at write time
+    def __init__(self, stream=None, name="stdout"):
+        self.stream = stream
+        self.name = name
+
+    def write(self, events):
+        stream = self.stream or sys.stdout
+        stream.write("".join(event.to_json() + "\n" for event in events))
+        stream.flush()
+
+    def close(self):
+        (self.stream or sys.stdout).flush()
+
+class FileSink(StreamSink):
+    def __init__(self, path):
+        super().__init__(open(path, 'a', encoding="utf-8"), f"file:{path}")
+
+    def close(self):
+        self.stream.close()
+
+class SocketSink:
+    # NDJSON over tcp:HOST:PORT or unix:PATH, reconnecting after a failed write
+    def __init__(self, address):
+        self.address = address
+        self.name = address
+        self.connection = None
+
+    def connect(self):
+        kind, _, target = self.address.partition(":")
+        if kind == "unix":
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(target)
+            return connection
+        host, _, port = target.rpartition(":")
+        return socket.create_connection((host, int(port)), timeout=10)
+
+    def write(self, events):
+        if self.connection is None:
+            self.connection = self.connect()
+        try:
+            self.connection.sendall("".join(event.to_json() + "\n" for event in events).encode("utf-8"))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class QueueSink:
+    # In-process consumers read AlertEvents from self.queue. Not offered as an --output, nothing
+    # in the monitor itself reads the queue
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.name = "queue"
+
+    def write(self, events):
+        for event in events:
+            self.queue.put(event)
+
+    def close(self):
+        pass
+
+class WebhookSink:
+    # Stand-in for a webhook consumer: POSTs every batch as {"events": [...]} to the URL
+    def __init__(self, url):
+        self.url = url
+        self.name = f"webhook:{url}"
+
+    def write(self, events):
+        response = get_session().post(self.url, json={"events": [dataclasses.asdict(event) for event in events]}, timeout=10)
+        response.raise_for_status()
+
+    def close(self):
+        pass
+
+def make_sink(spec):
+    # "stdout", "file:PATH", "tcp:HOST:PORT", "unix:PATH" or "webhook:URL"
+    kind, _, target = spec.partition(":")
+    if kind == "stdout":
+        return StreamSink()
+    if kind == "file" and target:
+        return FileSink(target)
+    if kind in ("tcp", "unix") and target:
+        return SocketSink(spec)
+    if kind == "webhook" and target:
+        return WebhookSink(target)
+    raise ValueError(f"Unknown output {spec!r}, use stdout, file:PATH, tcp:HOST:PORT, unix:PATH or webhook:URL")
+
+class OutputWriter:
+    # Alerts go into a bounded buffer and a background thread hands them to the sinks in
+    # batches, so a slow consumer never holds up the poll loop. Until start() is called
+    # alerts are written right away from the calling thread.
+    def __init__(self, sinks, buffer_size=OUTPUT_BUFFER, batch_size=OUTPUT_BATCH, flush_interval=OUTPUT_FLUSH_INTERVAL):
+        self.sinks = list(sinks)
+        self.buffer = queue.Queue(maxsize=max(1, buffer_size))
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.thread = None
+        self.lock = threading.Lock() # serialises direct writes before start()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop, name="output", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+            output_writers.append(self)
+        return self
+
+    def publish(self, event):
+        metrics.inc("fi_output_events_total")
+        if self.thread is None:
+            with self.lock:
+                self.deliver([event])
+            return
+        try:
+            self.buffer.put_nowait(event)
+        except queue.Full:
+            # backpressure: the sinks are behind, wait for room instead of dropping the alert
+            metrics.inc("fi_output_buffer_full_total")
+            with metrics.timer("fi_output_blocked_seconds"):
+                self.buffer.put(event)
+
+    def loop(self):
+        while True:
+            batch = []
+            taken = 0
+            deadline = None # a batch waits flush_interval from its first alert
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.buffer.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                taken += 1
+                if event is None or event is OUTPUT_FLUSH:
+                    break
+                batch.append(event)
+                deadline = deadline or time.monotonic() + self.flush_interval
+            if batch:
+                self.deliver(batch)
+            for _ in range(taken):
+                self.buffer.task_done()
+            if event is None:
+                return
+
+    def deliver(self, batch):
+        metrics.inc("fi_output_batches_total")
+        for sink in self.sinks:
+            for attempt in range(OUTPUT_RETRIES):
+                try:
+                    with metrics.timer("fi_output_write_seconds"):
+                        sink.write(batch)
+                    break
+                except Exception as e:
+                    metrics.inc("fi_output_errors_total", sink=sink.name)
+                    log(f"Error writing {len(batch)} alerts to {sink.name}: {e}")
+                    if attempt + 1 < OUTPUT_RETRIES:
+                        time.sleep(2 ** attempt)
+
+    def drain(self):
+        # Returns once every alert published so far has been handed to the sinks
+        if self.thread is not None:
+            self.buffer.put(OUTPUT_FLUSH)
+            self.buffer.join()
+
+    def depth(self):
+        return self.buffer.qsize()
+
+    def close(self):
+        if self.thread is not None:
+            self.buffer.put(None)
+            self.thread.join(timeout=30)
+            self.thread = None
+            if self in output_writers:
+                output_writers.remove(self)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
+
+output = OutputWriter([StreamSink()])
+output_writers = [] # started OutputWriters
+
+def drain_outputs():
+    # Called before reports are marked seen: a report whose alert is still in a buffer when
+    # the process dies must not count as seen after a restart
+    for writer in list(output_writers):
+        writer.drain()
+
+PROFILE_KEYS = {"name", "threshold", "rules", "output", "templates", "language"}
+
+@dataclasses.dataclass(eq=False)
+class Profile:
+    name: str
+    rules: RuleMatcher
+    output: OutputWriter
+    templates: object = None # TemplateSet, None uses the --templates wording
+
+def load_profiles(path, threshold, rules=None, templates_path=None, language=TEMPLATE_LANGUAGE):
+    # JSON file: {"profiles": [{"name": ..., "threshold": ..., "rules": <rules file or list>, "output": [<output>, ...],
+    # "templates": <templates file or {case: template}>, "language": ...}, ...]}
+    # Missing values fall back to --threshold, --rules, --output, --templates and --language
+    with open(path, 'r', encoding="utf-8") as f:
+        config = json.load(f)
+    profiles = []
+    for entry in config["profiles"] if isinstance(config, dict) else config:
+        unknown = set(entry) - PROFILE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in profile {entry.get('name')}: {', '.join(sorted(unknown))}")
+        name = entry.get("name") or f"profile{len(profiles) + 1}"
+        if any(profile.name == name for profile in profiles):
+            raise ValueError(f"Duplicate profile name {name}")
+        profile_threshold = entry.get("threshold", threshold)
+        profile_rules = entry.get("rules")
+        if isinstance(profile_rules, str):
+            matcher = load_rules(profile_rules, profile_threshold)
+        elif profile_rules:
+            matcher = build_rules(profile_rules, profile_threshold)
+        elif "threshold" in entry or rules is None:
+            matcher = default_rules(profile_threshold)
+        else:
+            matcher = rules
+        outputs = entry.get("output")
+        outputs = [outputs] if isinstance(outputs, str) else outputs
+        writer = OutputWriter([make_sink(spec) for spec in outputs]) if outputs else output
+        profile_templates = entry.get("templates")
+        if isinstance(profile_templates, str):
+            profile_templates = TemplateSet.load(profile_templates, entry.get("language", language))
+        elif profile_templates:
+            if "language" in entry:
+                raise ValueError(f"Profile {name} has inline templates, its language only applies to a templates file")
+            profile_templates = TemplateSet(profile_templates)
+        elif "language" in entry and entry["language"] != language:
+            # the --templates wording in another language
+            if not templates_path:
+                raise ValueError(f"Profile {name} asks for language '{entry['language']}' but there is no --templates file to take it from")
+            profile_templates = TemplateSet.load(templates_path, entry["language"])
+        profiles.append(Profile(name, matcher, writer, profile_templates))
+    if not profiles:
+        raise ValueError(f"No profiles in {path}")
+    return profiles
+
+def emit_report(report_url, report_index, output_sentences, profiles=None, event_type="alert", preliminary=False, transaction_results=None):
+    # an update is sent even without sentences, it then withdraws the preliminary alert.
+    # Profiles with their own templates render transaction_results in their own wording.
+    if output_sentences or event_type == "update":
+        flags = [result.get("share_option") for result in transaction_results or []]
+        share_option = any(flags) if flags and None not in flags else None
+        if profiles is None:
+            output.publish(AlertEvent(report_url, report_index, output_sentences, type=event_type, preliminary=preliminary, share_option=share_option))
+        for profile in profiles or []:
+            sentences = profile.templates.render(transaction_results) if profile.templates and transaction_results is not None else output_sentences
+            profile.output.publish(AlertEvent(report_url, report_index, sentences, profile=profile.name, type=event_type, preliminary=preliminary, share_option=share_option))
+            metrics.inc("fi_profile_alerts_total", profile=profile.name)
+        log(f"Reports processed successfully...")
+    else:
+        log(f"No relevant transactions found in report {report_index}")
+
+def finish_report(report, report_url, report_index, transaction_results, profiles=None):
+    # Emits the alert from the detail page, as an update when a preliminary alert went out
+    metrics.inc("fi_reports_processed_total")
+    report_status.pop(report, None)
+    report_rows.pop(report, None)
+    output_sentences = render_sentences(transaction_results)
+    if preliminary_alerts.pop(report, None) is not None:
+        emit_report(report_url, report_index, output_sentences, profiles, event_type="update", transaction_results=transaction_results)
+        metrics.inc("fi_alert_updates_total")
+        return
+    emit_report(report_url, report_index, output_sentences, profiles, transaction_results=transaction_results)
+    if output_sentences:
+        metrics.inc("fi_alerts_total")
+        metrics.alert_sent(report)
+
+fast_alerts = False # --fast_alerts
+report_rows = LRUDict() # report link -> its search rows, kept for the --fast_alerts path
+preliminary_alerts = LRUDict() # report link -> sentences of the alert sent from its search rows, until the detail page is in
+
+def row_transactions(rows):
+    # transaction_results built from the search rows of one report, or None when the rows
+    # are not enough: closely associated parties are only named on the detail page
+    transaction_results = []
+    for cells in rows:
+        if len(cells) < 16:
+            continue
+        if cells[4] != "": # the matcher reads any value in this column as closely associated
+            return None
+        issuer_clean = normalizer.issuer(cells[1])
+        position, position_combined = normalizer.position(cells[3], issuer_clean)
+        report = {
+            "obligated_name": cells[2],
+            "obligated_clean_name": normalizer.company(cells[2]).lower(),
+            "managerial_person": cells[2],
+            "position": position,
+            "position_combined": position_combined,
+            "issuer": cells[1],
+            "issuer_clean": issuer_clean,
+            "isClose": False,
+        }
+        transaction_results.append(transaction_record(
+            report,
+            instrument=cells[6],
+            transaction=cells[5],
+            volume=cells[10],
+            price_pu=cells[12],
+            currency=cells[13],
+            transaction_date=cells[9],
+            transaction_place="", # only on the detail page
+        ))
+    return transaction_results or None
+
+def emit_preliminary(report, profiles=None):
+    # --fast_alerts: send the alert from the search rows right away, the detail page
+    # then follows up with an "update" event that adds the transaction place or corrects it
+    rows = report_rows.pop(report, None)
+    if report in preliminary_alerts:
+        return
+    transaction_results = row_transactions(rows) if rows else None
+    output_sentences = render_sentences(transaction_results) if transaction_results else []
+    if not output_sentences:
+        return
+    preliminary_alerts[report] = output_sentences
+    emit_report(f"{BASE_URL}{report}", report.split("/Index/")[1].split("?")[0], output_sentences, profiles, preliminary=True, transaction_results=transaction_results)
+    if ha is not None:
+        ha.replicate_preliminary(report, output_sentences)
+    metrics.inc("fi_alerts_total")
+    metrics.inc("fi_preliminary_alerts_total")
+    metrics.alert_sent(report)
+
+# Labels of the detail page (matched anywhere in the label text, case insensitive) and the
+# ReportDetails field they fill. Add a line here to pick up another field.
+DETAIL_LABELS = {
+    "obligated_name": "Name of person with notification obligation",
+    "closely_associated": "Closely associated",
+    "managerial_person": "Person discharging managerial responsibilities",
+    "position": "Position",
+    "initial_notification": "Initial notification",
+    "issuer": "Name of issuer",
+    "lei": "LEI",
+}
+DETAIL_LABEL_PATTERN = re.compile("|".join(f"(?P<{field}>{re.escape(label)})" for field, label in DETAIL_LABELS.items()), re.IGNORECASE)
+DETAIL_FLAGS = {"closely_associated", "initial_notification"} # "Yes" / "No" values
+SHARE_OPTION_INPUT = re.compile(r"ÄrKoppladTillAktieoptionsprogram\d+")
+
+@dataclasses.dataclass
+class ReportDetails:
+    obligated_name: str = None
+    closely_associated: bool = False
+    managerial_person: str = None
+    position: str = None
+    initial_notification: bool = False
+    issuer: str = None
+    lei: str = None
+
+def extract_report_details(soup):
+    # One pass over the label divs, the first label found for a field wins
+    details = ReportDetails()
+    found = set()
+    for label in soup.find_all("div", {"class": "col-sm-4 text-right"}):
+        match = label.string and DETAIL_LABEL_PATTERN.search(label.string)
+        if not match or match.lastgroup in found:
+            continue
+        value_div = label.find_next_sibling("div")
+        if value_div is None:
+            continue
+        found.add(match.lastgroup)
+        value = value_div.text.strip()
+        setattr(details, match.lastgroup, value == "Yes" if match.lastgroup in DETAIL_FLAGS else value)
+        if len(found) == len(DETAIL_LABELS):
+            break
+    return details
+
+# Lowercased position as FI shows it -> (short title, title with the issuer)
+POSITION_TITLES = {
+    "chief executive officer (ceo)/managing directory": ("CEO", "CEO OF {issuer}"),
+    "chief operating officer (coo)": ("COO", "COO OF {issuer}"),
+    "chief technology officer (cto)": ("CTO", "CTO OF {issuer}"),
+    "chief financial officer (cfo)": ("CFO", "CFO OF {issuer}"),
+    "member of the board of directors": ("Board Member", "Board Member of {issuer}"),
+    "chairman of the board of directors": ("Chairman of the Board", "Chairman of {issuer} Board"),
+    "other senior executive": ("Senior Executive", "Senior Executive of {issuer}"),
+    "member of the supervisory board": ("Supervisory Board Member", "Supervisory Board Member of {issuer}"),
+    "other member of the company's administrative, management or supervisory body": ("Executive", "Executive of {issuer}"),
+}
+# Legal forms dropped from the end of company names, longest alternatives first
+LEGAL_FORM_SUFFIXES = [
+    "ab (publ.)", "ab (publ)", "(publ.)", "(publ)", "abp", "ab", "hb", "kb",
+    "asa", "as", "a/s", "oyj", "oy", "plc", "se", "s.a.", "n.v.", "ag",
+]
+# Lowercased issuer without its legal form -> name used in alerts
+ISSUER_OVERRIDES = {
+    "h & m hennes & mauritz": "H&M",
+}
+NORMALIZER_CACHE_SIZE = 4096
+
+class Normalizer:
+    # Table driven cleanup of issuer, person and position names. The same issuers and
+    # people file over and over, so results are kept in LRU caches.
+    def __init__(self, positions=None, suffixes=None, issuers=None, cache_size=NORMALIZER_CACHE_SIZE):
+        # kept so parse worker processes can build the same normalizer
+        self.config = {"positions": positions, "suffixes": suffixes, "issuers": issuers, "cache_size": cache_size}
+        self.positions = {key.lower(): tuple(value) for key, value in (positions or POSITION_TITLES).items()}
+        self.issuers = {key.lower(): value for key, value in (issuers or ISSUER_OVERRIDES).items()}
+        suffixes = sorted(suffixes or LEGAL_FORM_SUFFIXES, key=len, reverse=True)
+        # a legal form only counts as a separate word (or a bracketed "(publ)")
+        self.suffix_pattern = re.compile(
+            r"(?:\s+(?:" + "|".join(re.escape(suffix) for suffix in suffixes if not suffix.startswith("(")) + r")"
+            + "".join(r"|\s*" + re.escape(suffix) for suffix in suffixes if suffix.startswith("(")) + r")\s*$",
+            re.IGNORECASE,
+        )
+        self.company = functools.lru_cache(maxsize=cache_size)(self.strip_legal_form)
+        self.issuer = functools.lru_cache(maxsize=cache_size)(self.clean_issuer)
+        self.position = functools.lru_cache(maxsize=cache_size)(self.clean_position)
+
+    @classmethod
+    def load(cls, path):
+        # JSON file: {"positions": {...}, "suffixes": [...], "issuers": {...}}, merged over the built in tables
+        with open(path, 'r', encoding="utf-8") as f:
+            config = json.load(f)
+        unknown = set(config) - {"positions", "suffixes", "issuers"}
+        if unknown:
+            raise ValueError(f"Unknown keys in {path}: {', '.join(sorted(unknown))}")
+        return cls(
+            positions={**POSITION_TITLES, **config.get("positions", {})},
+            suffixes=[*LEGAL_FORM_SUFFIXES, *config.get("suffixes", [])],
+            issuers={**ISSUER_OVERRIDES, **config.get("issuers", {})},
+        )
+
+    def strip_legal_form(self, name):
+        return self.suffix_pattern.sub("", name.strip())
+
+    def clean_issuer(self, issuer):
+        name = self.company(issuer)
+        return self.issuers.get(name.lower()) or name.title()
+
+    def clean_position(self, position_full, issuer_clean):
+        # (position, position_combined), positions without a table entry are kept as written
+        if not position_full:
+            return "", ""
+        position_text = position_full.strip().lower()
+        if position_text not in self.positions:
+            return position_text, position_text
+        title, combined = self.positions[position_text]
+        return title, combined.format(issuer=issuer_clean)
+
+    def hit_rate(self):
+        hits = misses = 0
+        for cached in (self.company, self.issuer, self.position):
+            info = cached.cache_info()
+            hits += info.hits
+            misses += info.misses
+        return hits / (hits + misses) if hits + misses else 0.0
+
+normalizer = Normalizer() # replaced by the tables from --normalization when run from the command line
+metrics.gauge_function("fi_normalizer_cache_hit_ratio", lambda: normalizer.hit_rate())
+
+def process_report(report):
+    import requests
+    report_index = report.split("/Index/")[1].split("?")[0]
+    report_url = f"{BASE_URL}{report}"
+    log(f"Checking inside the report: {report_index}")
+    status = report_status.get(report)
+    cached = detail_cache.get(report_index, status) if detail_cache else None
+    if cached and cached[1] is not None:
+        if history:
+            history.append(report_index, cached[1])
+        return report_url, report_index, cached[1]
+
+    if cached:
+        page = cached[0]
+    else:
+        try:
+            page = fetch_report(report_url)
+        except requests.RequestException as e:
+            log(f"Error fetching report {report}: {e}")
+            return None
+        if page is None:
+            return None
+
+    transaction_results = parse_report(page)
+    if detail_cache:
+        detail_cache.put(report_index, status, page, transaction_results)
+    if history:
+        history.append(report_index, transaction_results)
+    return report_url, report_index, transaction_results
+
+def fetch_report(report_url):
+    import requests
+    try:
+        with metrics.timer("fi_report_fetch_seconds"):
+            response = get_session().get(report_url, timeout=10)
+    except requests.RequestException:
+        metrics.inc("fi_http_errors_total")
+        raise
+    metrics.inc("fi_http_responses_total", status=response.status_code)
+    response.raise_for_status()
+    # Retry logic: try up to 3 times with a 2 second delay between attempts
+    for attempt in range(3):
+        if response.status_code == 200:
+            break
+        else:
+            time.sleep(2)
+            metrics.inc("fi_http_retries_total")
+            try:
+                response = get_session().get(report_url, timeout=10)
+                metrics.inc("fi_http_responses_total", status=response.status_code)
+            except requests.RequestException:
+                metrics.inc("fi_http_errors_total")
+                continue
+    if response.status_code == 200:
+        return response.text
+    return None
+
+def parse_report(page):
+    import bs4
+    soup = bs4.BeautifulSoup(page, "html.parser")
+    details = extract_report_details(soup)
+    obligated_name = details.obligated_name
+
+    isClose = details.closely_associated
+    managerial_person = details.managerial_person
+    isInitial = details.initial_notification
+    issuer = details.issuer or ""
+
+    obligated_clean_name = normalizer.company(obligated_name or "").lower()
+    issuer_clean = normalizer.issuer(issuer)
+    position, position_combined = normalizer.position(details.position, issuer_clean)
+
+    # transaction details
+    transaction_table = soup.find("table", {"class": "table table-bordered table-hover table-striped"})
+    rows = transaction_table.find("tbody").find_all("tr")
+    report = {
+        "obligated_name": obligated_name or "",
+        "obligated_clean_name": obligated_clean_name,
+        "managerial_person": managerial_person,
+        "position": position,
+        "position_combined": position_combined,
+        "issuer": issuer,
+        "issuer_clean": issuer_clean,
+        "isClose": isClose,
+    }
+    transaction_results = []  # Move this OUTSIDE the transaction loop
+    for row in rows:
+        cells = row.find_all("td")
+        isShareOption = (row.find("input", {"name": SHARE_OPTION_INPUT}) or {}).get("value", "").lower() == "true"
+        transaction_result = transaction_record(
+            report,
+            instrument=cells[1].text.strip(),
+            transaction=cells[3].text.strip(),
+            volume=cells[5].text.strip(),
+            price_pu=cells[7].text.strip(),
+            currency=cells[8].text.strip(),
+            transaction_date=cells[9].text.strip(),
+            transaction_place=cells[10].text.strip(),
+            share_option=isShareOption,
+        )
+        transaction_results.append(transaction_result)
+
+    #aggregate details:
+    # aggr_panel = soup.find("div", class_="panel-heading", 
+    #             string=re.compile(r"\s*Aggregation\s*", re.IGNORECASE))
+    # aggr_table = aggr_panel.find_next("table") if aggr_panel else None
+    
+    # if aggr_table and aggr_table.find("tbody"):
+    #     aggr_rows = aggr_table.find("tbody").find_all("tr")
+    #     for aggr_row in aggr_rows:
+    #         aggr_cells = aggr_row.find_all("td")
+
+    #         aggr_fin_instrument = aggr_cells[0].text.strip()
+    #         aggr_isin = aggr_cells[1].text.strip()
+    #         aggr_transaction = aggr_cells[2].text.strip()
+    #         aggr_date = aggr_cells[3].text.strip()
+    #         aggr_place = aggr_cells[4].text.strip()
+    #         aggr_volume = aggr_cells[5].text.strip()
+    #         aggr_price_pu = aggr_cells[6].text.strip()
+
+    #         aggr_volume_clean = aggr_volume.replace("(Quantity)", "").replace(",", "").strip() if aggr_volume else "0"
+    #         aggr_price_pu_clean = aggr_price_pu.replace("SEK", "").replace(",", "").strip() if aggr_price_pu else "0"
+            
+    #         try:
+    #             aggr_volume_float = float(aggr_volume_clean)
+    #             aggr_price_pu_float = float(aggr_price_pu_clean)
+    #             aggr_total_value = aggr_volume_float * aggr_price_pu_float
+    #         except ValueError:
+    #             aggr_volume_float = 0.0
+    #             aggr_price_pu_float = 0.0
+    #             aggr_total_value = 0.0
+
+    # print("-------------- aggregate details --------------")
+    # print(f"Aggregate financial instrument: {aggr_fin_instrument}")
+    # print(f"Aggregate transaction: {aggr_transaction}")
+    # print(f"Aggregate place: {aggr_place}")
+    # print(f"Aggregate volume: {aggr_volume}")
+    # print(f"Aggregate price per unit: {aggr_price_pu}")
+    # print(f"Aggregate total value: {aggr_total_value:.2f}")
+    # print("-------------- ------------------ --------------")
+
+    return transaction_results
+
+def transaction_record(report, instrument, transaction, volume, price_pu, currency, transaction_date, transaction_place, share_option=None):
+    # One transaction_result from the report level fields (names, position, issuer) and
+    # the values of one transaction, shared by the detail page and the search row paths.
+    # share_option is only on the detail page, None from the search rows.
+    #clean instrument name
+    clean_instrument = instrument.split(",")[0].strip()
+    if clean_instrument.endswith(" AB"):
+        clean_instrument = clean_instrument[:-3].strip()
+
+    # dates
+    try:
+        dt = datetime.datetime.strptime(transaction_date, "%d/%m/%Y")
+        day = dt.day
+        if 4 <= day <= 20 or 24 <= day <= 30:
+            suffix = "th"
+        else:
+            suffix = ["st", "nd", "rd"][day % 10 - 1]
+        date_text = f"{dt.strftime('%B')} {day}{suffix}"
+        transaction_day = dt.date().isoformat()
+    except Exception:
+        date_text = transaction_date
+        transaction_day = ""
+
+    # Calculate total value
+    volume_clean = volume.replace(",", "").strip() if volume else "0"
+    price_pu_clean = price_pu.replace(",", "").strip() if price_pu else "0"
+    try:
+        volume_float = float(volume_clean)
+    except ValueError:
+        volume_float = 0.0
+    try:
+        price_pu_float = float(price_pu_clean)
+    except ValueError:
+        price_pu_float = 0.0
+    total_value = volume_float * price_pu_float if volume_float and price_pu_float else 0.0
+
+    total_value_str = format_total_value(total_value)
+    total_value_base = fx_rates.to_base(total_value, currency)
+
+    match transaction:
+        case "Acquisition":
+            transaction_text = "acquired"
+        case "Disposal":
+            transaction_text = "disposed"
+        case _:
+            transaction_text = transaction
+
+    transaction_result = {
+        "obligated_name": report["obligated_name"].upper(),
+        "obligated_clean_name": report["obligated_clean_name"].upper(),
+        "managerial_person": report["managerial_person"].upper(),
+        "position": report["position"].upper(),
+        "issuer": report["issuer"].upper(),
+        "issuer_clean": report["issuer_clean"].upper(),
+        "position_combined": report["position_combined"].upper(),
+        "clean_instrument": clean_instrument.upper(),
+        "transaction": transaction.upper(),
+        "transaction_text": transaction_text.upper(),
+        "currency": currency.upper(),
+        "volume": volume_clean.upper(),
+        "total_value": total_value,
+        "total_value_str": total_value_str.upper(),
+        "total_value_base": total_value_base,
+        "total_value_base_str": format_total_value(total_value_base).upper(),
+        "base_currency": BASE_CURRENCY,
+        "date_text": date_text.upper(),
+        "transaction_date": transaction_day,
+        "transaction_place": transaction_place.upper(),
+        "isClose": report["isClose"],
+        "share_option": share_option,
+    }
+    return transaction_result
+
+class TemplateSet:
+    # Sentence templates compiled once into functions over a transaction_result. Each
+    # transaction is written with the template of its case (value or volume, insider or
+    # closely associated), the place line is added when the report names a place.
+    def __init__(self, templates=None):
+        templates = {**DEFAULT_TEMPLATES, **(templates or {})}
+        unknown = set(templates) - set(DEFAULT_TEMPLATES)
+        if unknown:
+            raise ValueError(f"Unknown templates: {', '.join(sorted(unknown))}, use {', '.join(DEFAULT_TEMPLATES)}")
+        self.templates = templates
+        self.compiled = {case: compile_template(text) for case, text in templates.items()}
+        # a format spec that does not fit its tag (e.g. {volume:,.0f}, volume is text) fails here, not per alert
+        for case, render in self.compiled.items():
+            try:
+                render(TEMPLATE_SAMPLE)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"Template {case} {templates[case]!r} cannot be rendered: {e}")
+
+    @classmethod
+    def load(cls, path, language=TEMPLATE_LANGUAGE):
+        # JSON file: {"en": {"insider_value": "...", ...}, "sv": {...}}, missing cases keep the built in wording
+        with open(path, 'r', encoding="utf-8") as f:
+            config = json.load(f)
+        if language not in config:
+            raise ValueError(f"No '{language}' templates in {path}, found {', '.join(config)}")
+        return cls(config[language])
+
+    def render(self, transaction_results):
+        output_sentences = []
+        append = output_sentences.append
+        compiled = self.compiled
+        insider = (compiled["insider_value"], compiled["insider_volume"])
+        closely_associated = (compiled["closely_associated_value"], compiled["closely_associated_volume"])
+        place = compiled["place"]
+        for transaction_result in transaction_results:
+            if transaction_result.get('transaction') not in ("ACQUISITION", "DISPOSAL"):
+                continue
+            transaction_place = transaction_result.get('transaction_place')
+            if transaction_place == "OUTSIDE A TRADING VENUE":
+                continue
+            total_value = transaction_result.get('total_value', 0)
+            if total_value < 0:
+                continue
+            by_value = insider if transaction_result.get('isClose') == False else closely_associated
+            append(by_value[total_value == 0](transaction_result))
+            if transaction_place: # not known for alerts from search rows
+                append(place(transaction_result))
+        return output_sentences
+
+TEMPLATE_SAMPLE = { # a transaction_result with every tag, for checking templates when they are loaded
+    "obligated_name": "Stefan Persson",
+    "obligated_clean_name": "ramsbury invest",
+    "managerial_person": "STEFAN PERSSON",
+    "position": "CEO",
+    "position_combined": "CEO OF MENDUS",
+    "issuer": "Mendus AB",
+    "issuer_clean": "MENDUS",
+    "clean_instrument": "Mendus",
+    "transaction": "ACQUISITION",
+    "transaction_text": "acquired",
+    "volume": "25000",
+    "currency": "SEK",
+    "total_value": 1234567.0,
+    "total_value_str": "1.2 MLN",
+    "total_value_base": 1234567.0,
+    "total_value_base_str": "1.2 MLN",
+    "base_currency": "SEK",
+    "date_text": "July 1st",
+    "transaction_date": "2026-07-01",
+    "transaction_place": "NASDAQ STOCKHOLM AB",
+    "isClose": False,
+    "share_option": False,
+}
+
+def compile_template(text):
+    # "{managerial_person} ACQUIRED {volume}" -> lambda r: f"{r['managerial_person']} ACQUIRED {r['volume']}",
+    # placeholders must be tags from --preview
+    tags = {tag["name"] for tag in preview()["tags"]}
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+        if literal:
+            parts.append(repr(literal))
+        if field is None:
+            continue
+        if field not in tags:
+            raise ValueError(f"Unknown tag {{{field}}} in template {text!r}, see the tags in --preview")
+        if set(spec) & set("{}'\"\\\n"):
+            raise ValueError(f"Unsupported format spec '{spec}' in template {text!r}")
+        if conversion and conversion not in ("r", "s", "a"):
+            raise ValueError(f"Unsupported conversion '!{conversion}' in template {text!r}, use !r, !s or !a")
+        parts.append("f\"{r['" + field + "']" + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}\"")
+    return eval(f"lambda r: {' '.join(parts) or repr('')}", {})
+
+templates = None # TemplateSet from --templates, built on first use otherwise
+
+def render_sentences(transaction_results):
+    global templates
+    if templates is None:
+        templates = TemplateSet()
+    return templates.render(transaction_results)
+
+def fetch_backfill_page(url, retries=BACKFILL_RETRIES):
+    # The rows of one search page, None when it could not be read. poll_website gives up on a
+    # 429 or 5xx right away, a backfill page is worth waiting for. A page without the results
+    # table (maintenance or error page) is retried the same way.
+    for attempt in range(retries + 1):
+        main_page = poll_website(url, max_retries=1)
+        rows = extract_rows(main_page) if main_page else None
+        if rows is not None or attempt == retries:
+            return rows
+        if main_page:
+            log(f"No results table in {url}")
+        wait_time = max(2 ** attempt, retry_after_hints.pop(url, None) or 0)
+        metrics.inc("fi_http_retries_total")
+        log(f"Retrying in {wait_time} seconds...")
+        time.sleep(wait_time)
+
+def backfill(threshold, date_from="", date_to="", max_workers=MAX_WORKERS, ordered=False, max_pages=BACKFILL_MAX_PAGES, rules=None):
+    # Walks the paginated search for the publication date range, max_workers pages at a time.
+    # Every finished page goes through the same filter and its reports are emitted right away.
+    rules = rules or default_rules(threshold)
+    log(f"Backfilling reports published from {date_from or 'the start'} to {date_to or 'today'}...")
+    last_page = max_pages # lowered once an empty page shows where the results end
+    first_links = set() # guards against the site repeating its last page for out of range page numbers
+    processed_count = 0
+    failed_pages = []
+    failed_reports = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {}
+        next_page = 1
+
+        def submit_next():
+            nonlocal next_page
+            if next_page <= last_page:
+                pending[executor.submit(fetch_backfill_page, SEARCH_URL.format(date_from=date_from, date_to=date_to, page=next_page))] = next_page
+                next_page += 1
+
+        for _ in range(max(1, max_workers)):
+            submit_next()
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                page = pending.pop(future)
+                rows = future.result()
+                if rows is None:
+                    log(f"Failed to fetch page {page}, skipping it")
+                    failed_pages.append(page)
+                    submit_next()
+                    continue
+
+                first_link = next((report_link for _, report_link in rows if report_link), None)
+                if not first_link or first_link in first_links:
+                    last_page = min(last_page, page - 1)
+                    continue
+                first_links.add(first_link)
+                submit_next()
+
+                routes = filter_rows(rows, rules)
+                new_reports = [report for report in routes if report not in seen_reports]
+                log(f"Page {page}: {len(rows)} rows, {len(new_reports)} new reports")
+                if new_reports:
+                    processed_reports = parse_new_reports(new_reports, max_workers, ordered, routes)
+                    drain_outputs()
+                    seen_reports.update(processed_reports)
+                    processed_count += len(processed_reports)
+                    if len(processed_reports) < len(new_reports):
+                        failed_reports += len(new_reports) - len(processed_reports)
+                        log(f"Page {page}: {len(new_reports) - len(processed_reports)} reports failed, they stay unseen for the next run")
+
+    failed_pages = sorted(page for page in failed_pages if page <= last_page)
+    log(f"Backfill finished, {processed_count} reports processed")
+    if failed_pages or failed_reports:
+        log(f"Backfill incomplete: {failed_reports} reports failed, pages that could not be fetched: {', '.join(map(str, failed_pages)) or 'none'}")
+    return processed_count, failed_pages, failed_reports
+
+def advance_high_water_mark(link=None):
+    # Only called once the reports of a cycle were handled, a failed cycle is read again in full
+    global high_water_mark
+    high_water_mark = link or newest_report_link
+    if ha is not None:
+        ha.replicate_high_water_mark(high_water_mark)
+
+def rewind_high_water_mark():
+    # Forget the mark and the page validators, the next poll reads the whole search page
+    global high_water_mark
+    high_water_mark = None
+    page_validators.pop(URL, None)
+    if ha is not None:
+        ha.replicate_high_water_mark(high_water_mark)
+
+def parse_windows(text):
+    # "07:55-09:00,17:25-18:30" -> [(475, 540), (1045, 1110)] in minutes after midnight
+    windows = []
+    for window in filter(None, (part.strip() for part in text.split(","))):
+        start, end = (datetime.datetime.strptime(t.strip(), "%H:%M") for t in window.split("-"))
+        windows.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return windows
+
+def stockholm_now():
+    return datetime.datetime.now(STOCKHOLM_TZ) if STOCKHOLM_TZ else datetime.datetime.now()
+
+class PollScheduler:
+    # Decides how long to wait before the next poll. Short after new filings and during the
+    # peak windows, the plain poll_interval during business hours, and exponentially longer
+    # when it is quiet outside business hours or when FI answers with errors / 429s.
+    # Peak windows and business hours only apply on weekdays, in Stockholm time.
+    def __init__(self, poll_interval, min_interval=None, max_interval=None,
+                 peak_windows=PEAK_WINDOWS, business_hours=BUSINESS_HOURS, active_cycles=ACTIVE_CYCLES):
+        self.poll_interval = poll_interval
+        self.min_interval = min(min_interval or max(5, poll_interval // 4), poll_interval)
+        self.max_interval = max(max_interval or 600, poll_interval)
+        self.peak_windows = parse_windows(peak_windows)
+        self.business_hours = parse_windows(business_hours)
+        self.active_cycles = active_cycles
+        self.cycles_since_activity = active_cycles
+        self.quiet_cycles = 0
+        self.error_cycles = 0
+        self.retry_after = 0
+        self.current_interval = poll_interval
+        self.next_poll_at = time.monotonic()
+
+    def record(self, new_rows=False, error=False, retry_after=None):
+        if error:
+            self.error_cycles += 1
+            self.retry_after = retry_after or 0
+        else:
+            self.error_cycles = 0
+            self.retry_after = 0
+            if new_rows:
+                self.cycles_since_activity = 0
+                self.quiet_cycles = 0
+            else:
+                self.cycles_since_activity += 1
+                self.quiet_cycles += 1
+        self.current_interval = self.compute_interval(stockholm_now())
+        self.next_poll_at = time.monotonic() + self.current_interval
+        return self.current_interval
+
+    def compute_interval(self, now):
+        if self.error_cycles:
+            backoff = self.poll_interval * 2 ** min(self.error_cycles - 1, 10)
+            return max(self.retry_after, min(self.max_interval, backoff))
+        if self.cycles_since_activity < self.active_cycles or self.in_windows(now, self.peak_windows):
+            return self.min_interval
+        if self.in_windows(now, self.business_hours):
+            return self.poll_interval
+        backoff = self.poll_interval * 2 ** min(self.quiet_cycles, 10)
+        # don't sleep through the start of the next business day or peak window
+        return max(self.min_interval, min(self.max_interval, backoff, self.seconds_until_window(now)))
+
+    def in_windows(self, now, windows):
+        minute = now.hour * 60 + now.minute
+        return now.weekday() < 5 and any(start <= minute < end for start, end in windows)
+
+    def seconds_until_window(self, now):
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in range(8):
+            date = midnight + datetime.timedelta(days=day)
+            if date.weekday() >= 5:
+                continue
+            for start, _ in sorted(self.peak_windows + self.business_hours):
+                window_start = date + datetime.timedelta(minutes=start)
+                if window_start > now:
+                    return (window_start - now).total_seconds()
+        return self.max_interval
+
+    def time_to_next_poll(self):
+        return max(0.0, self.next_poll_at - time.monotonic())
+
+    def sleep(self):
+        time.sleep(self.time_to_next_poll())
+
+def run(threshold, poll_interval, max_workers=MAX_WORKERS, ordered=False, incremental=False, scheduler=None, rules=None, json_log=False):
+    scheduler = scheduler or PollScheduler(poll_interval)
+    rules = rules or default_rules(threshold)
+    metrics.gauge_function("fi_seen_reports", lambda: len(seen_reports))
+    metrics.gauge_function("fi_output_queue_depth", output.depth)
+    if detail_cache:
+        metrics.gauge_function("fi_detail_cache_bytes", detail_cache.size)
+    metrics.gauge_function("fi_poll_interval_seconds", lambda: scheduler.current_interval)
+    metrics.gauge_function("fi_next_poll_seconds", scheduler.time_to_next_poll)
+    while True:
+        if ha is not None:
+            ha.check() # raises LeaseLost once another instance may be polling
+        cycle_start = time.perf_counter()
+        scanned_before = metrics.value("fi_rows_scanned_total")
+        qualified_before = metrics.value("fi_rows_qualified_total")
+        new_reports = []
+        outcome = "error"
+        try:
+            log(f"Polling website for new reports...")
+            main_page = poll_website(URL, conditional=True)
+            if main_page is PAGE_UNCHANGED:
+                outcome = "unchanged"
+                scheduler.record(new_rows=False)
+                log(f"No changes on main page, next poll in {scheduler.time_to_next_poll():.0f}s")
+            elif not main_page:
+                scheduler.record(error=True, retry_after=last_poll["retry_after"])
+                log(f"Failed to fetch main page. Will retry in {scheduler.time_to_next_poll():.0f}s.")
+            else:
+                to_process = parse_mainpage(main_page, rules, incremental)
+                new_rows = newest_report_link != high_water_mark
+                log(f"Waiting for next polling cycle")
+                new_reports = [report for report in to_process if report not in seen_reports]
+                processed_reports = []
+                if new_reports:
+                    processed_reports = parse_new_reports(new_reports, max_workers, ordered, routes=to_process)
+                    log(f"Waiting for next report")
+                    drain_outputs()
+                    seen_reports.update(processed_reports)
+                if len(processed_reports) == len(new_reports):
+                    advance_high_water_mark()
+                else:
+                    rewind_high_water_mark() # the failed reports are read again on the next poll
+                outcome = "processed"
+                scheduler.record(new_rows=new_rows)
+                log(f"Waiting for next polling cycle, next poll in {scheduler.time_to_next_poll():.0f}s")
+        except KeyboardInterrupt:
+            log("Polling interrupted by user.")
+            break
+        except Exception as e:
+            log(f"Error in polling loop: {e}")
+            page_validators.pop(URL, None) # make sure the page is processed again
+            scheduler.record(error=True)
+
+        cycle_seconds = time.perf_counter() - cycle_start
+        metrics.observe("fi_cycle_seconds", cycle_seconds)
+        metrics.inc("fi_cycles_total", outcome=outcome)
+        if json_log:
+            log_cycle(
+                outcome=outcome,
+                cycle_ms=round(cycle_seconds * 1000, 1),
+                http_status=last_poll["status"],
+                rows_scanned=metrics.value("fi_rows_scanned_total") - scanned_before,
+                rows_qualified=metrics.value("fi_rows_qualified_total") - qualified_before,
+                new_reports=len(new_reports),
+                seen_reports=len(seen_reports),
+                interval_s=scheduler.current_interval,
+            )
+        try:
+            scheduler.sleep()
+        except KeyboardInterrupt:
+            log("Polling interrupted by user.")
+            break
+
+
+def init_parse_worker(normalizer_config):
+    # Runs once in each parse worker process, which starts from a fresh interpreter
+    global normalizer
+    normalizer = Normalizer(**normalizer_config)
+
+def parse_report_job(page, rates):
+    # Runs in a parse worker process, which has no FX refresh thread of its own
+    fx_rates.rates = rates
+    return parse_report(page)
+
+async def pipeline(threshold, poll_interval, max_workers=MAX_WORKERS, parse_workers=PARSE_WORKERS, incremental=False, scheduler=None, rules=None, json_log=False):
+    # Same work as run, split into stages joined by bounded queues: the search page poller,
+    # max_workers detail fetchers, parse_workers parsers (in a process pool) and one renderer
+    # that emits the alerts. The poller keeps its own cadence however slow the detail pages are.
+    import asyncio
+    import concurrent.futures.process
+    import multiprocessing
+    import pickle
+    scheduler = scheduler or PollScheduler(poll_interval)
+    rules = rules or default_rules(threshold)
+    loop = asyncio.get_running_loop()
+    fetch_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    parse_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    render_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    in_flight = {} # report -> profiles that get its alert, until the alert is out
+    pending_marks = [] # (newest link of a poll, reports in flight after it), oldest first
+    pool = None
+    if parse_workers:
+        # spawn rather than fork: the FX, metrics and output threads are already running,
+        # so the workers get the normalization tables through the initializer instead
+        pool = concurrent.futures.ProcessPoolExecutor(
+            parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_parse_worker,
+            initargs=(normalizer.config,),
+        )
+    metrics.gauge_function("fi_seen_reports", lambda: len(seen_reports))
+    metrics.gauge_function("fi_poll_interval_seconds", lambda: scheduler.current_interval)
+    metrics.gauge_function("fi_next_poll_seconds", scheduler.time_to_next_poll)
+    metrics.gauge_function("fi_output_queue_depth", output.depth)
+
+    def failed(report, e):
+        log(f"Error processing report {report}: {e}")
+        in_flight.pop(report, None)
+        pending_marks.clear() # none of them may pass the failed report
+        rewind_high_water_mark() # the next poll reads the whole page and picks the report up again
+
+    def settle(report):
+        # A poll's mark is only advanced (and journaled for the standbys) once every report that
+        # was in flight after it is out, so a takeover never starts above an unsent report
+        settled = None
+        for mark in pending_marks:
+            mark[1].discard(report)
+            if not mark[1]:
+                settled = mark
+        if settled is not None:
+            del pending_marks[: pending_marks.index(settled) + 1]
+            if settled[0]:
+                advance_high_water_mark(settled[0])
+
+    async def poller():
+        while True:
+            if ha is not None:
+                ha.check()
+            cycle_start = time.perf_counter()
+            outcome = "error"
+            queued = 0
+            try:
+                log(f"Polling website for new reports...")
+                main_page = await asyncio.to_thread(poll_website, URL, conditional=True)
+                if main_page is PAGE_UNCHANGED:
+                    outcome = "unchanged"
+                    scheduler.record(new_rows=False)
+                elif not main_page:
+                    scheduler.record(error=True, retry_after=last_poll["retry_after"])
+                else:
+                    routes = await asyncio.to_thread(parse_mainpage, main_page, rules, incremental)
+                    new_rows = newest_report_link != (pending_marks[-1][0] if pending_marks else high_water_mark)
+                    outcome = "processed"
+                    # oldest first, so with a single fetcher alerts come out in publication order
+                    for report in reversed([report for report in routes if report not in in_flight and report not in seen_reports]):
+                        try:
+                            fetch_queue.put_nowait(report)
+                        except asyncio.QueueFull:
+                            # the fetchers are behind, the rest is queued on a later poll
+                            outcome = "deferred"
+                            break
+                        in_flight[report] = routes.get(report) if isinstance(routes, dict) else None
+                        if fast_alerts:
+                            emit_preliminary(report, in_flight[report])
+                        queued += 1
+                    if outcome == "deferred":
+                        pending_marks.clear()
+                        rewind_high_water_mark()
+                    else:
+                        pending_marks.append((newest_report_link, set(in_flight)))
+                        settle(None)
+                    scheduler.record(new_rows=new_rows)
+            except Exception as e:
+                log(f"Error in polling loop: {e}")
+                page_validators.pop(URL, None) # make sure the page is processed again
+                scheduler.record(error=True)
+
+            cycle_seconds = time.perf_counter() - cycle_start
+            metrics.observe("fi_cycle_seconds", cycle_seconds)
+            metrics.inc("fi_cycles_total", outcome=outcome)
+            if history:
+                await asyncio.to_thread(history.flush)
+            for stage, stage_queue in (("fetch", fetch_queue), ("parse", parse_queue), ("render", render_queue)):
+                metrics.set("fi_pipeline_queue_depth", stage_queue.qsize(), stage=stage)
+            if json_log:
+                log_cycle(
+                    outcome=outcome,
+                    cycle_ms=round(cycle_seconds * 1000, 1),
+                    http_status=last_poll["status"],
+                    queued=queued,
+                    in_flight=len(in_flight),
+                    seen_reports=len(seen_reports),
+                    interval_s=scheduler.current_interval,
+                )
+            log(f"Queued {queued} reports, {len(in_flight)} in flight, next poll in {scheduler.time_to_next_poll():.0f}s")
+            await asyncio.sleep(scheduler.time_to_next_poll())
+
+    async def fetcher():
+        while True:
+            report = await fetch_queue.get()
+            report_index = report.split("/Index/")[1].split("?")[0]
+            try:
+                cached = await asyncio.to_thread(detail_cache.get, report_index, report_status.get(report)) if detail_cache else None
+                if cached and cached[1] is not None:
+                    if history:
+                        await asyncio.to_thread(history.append, report_index, cached[1])
+                    await render_queue.put((report, cached[1]))
+                    continue
+                page = cached[0] if cached else await asyncio.to_thread(fetch_report, f"{BASE_URL}{report}")
+                if page is None:
+                    raise ValueError("no page returned")
+                await parse_queue.put((report, page))
+            except Exception as e:
+                failed(report, e)
+
+    async def parser():
+        nonlocal pool
+        while True:
+            report, page = await parse_queue.get()
+            report_index = report.split("/Index/")[1].split("?")[0]
+            try:
+                try:
+                    if pool is None:
+                        raise concurrent.futures.process.BrokenProcessPool("no parse workers")
+                    transaction_results = await loop.run_in_executor(pool, parse_report_job, page, fx_rates.rates)
+                except (concurrent.futures.process.BrokenProcessPool, pickle.PicklingError) as e:
+                    if pool is not None:
+                        log(f"Parse workers unavailable ({e}), parsing in threads")
+                        pool = None
+                    transaction_results = await asyncio.to_thread(parse_report, page)
+                if detail_cache:
+                    await asyncio.to_thread(detail_cache.put, report_index, report_status.get(report), page, transaction_results)
+                if history:
+                    await asyncio.to_thread(history.append, report_index, transaction_results)
+                await render_queue.put((report, transaction_results))
+            except Exception as e:
+                failed(report, e)
+
+    async def renderer():
+        while True:
+            report, transaction_results = await render_queue.get()
+            report_index = report.split("/Index/")[1].split("?")[0]
+            try:
+                finish_report(report, f"{BASE_URL}{report}", report_index, transaction_results, profiles=in_flight.get(report))
+                await asyncio.to_thread(drain_outputs)
+                await asyncio.to_thread(seen_reports.add, report)
+                in_flight.pop(report, None)
+                settle(report)
+            except Exception as e:
+                failed(report, e)
+
+    stages = [poller(), renderer()]
+    stages += [fetcher() for _ in range(max(1, max_workers))]
+    stages += [parser() for _ in range(max(1, parse_workers or 1))]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+import json
+import os
+
+# Everything --preview reports, kept apart from the monitor so the host platform's
+# registration and health checks don't import it. preview.json is this dict as printed,
+# regenerate it with `python -m finansinspektionen.preview` after changing it.
+
+display_name = "Finansinspektionen Insider Reports Monitor"
+
+PREVIEW_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "preview.json")
+
+BASE_URL = "https://marknadssok.fi.se"
+SEARCH_URL = BASE_URL + "/Publiceringsklient/en-GB/Search/Search?SearchFunctionType=Insyn&Utgivare=&PersonILedandeStällningNamn=&Transaktionsdatum.From=&Transaktionsdatum.To=&Publiceringsdatum.From={date_from}&Publiceringsdatum.To={date_to}&button=search&Page={page}"
+URL = SEARCH_URL.format(date_from="", date_to="", page=1)
+
+TEMPLATE_LANGUAGE = "en"
+# Built in wording, one template per case; --templates and profiles can replace any of them
+DEFAULT_TEMPLATES = {
+    "insider_value": "{position_combined} {managerial_person} {transaction_text} {currency} {total_value_str} WORTH OF CO'S SHARES ON {date_text}-FINANSINSPEKTIONEN",
+    "insider_volume": "{position_combined} {managerial_person} {transaction_text} {volume} CO'S SHARES ON {date_text}-FINANSINSPEKTIONEN",
+    "closely_associated_value": "{obligated_clean_name}, CLOSELY ASSOCIATED WITH {position_combined} {managerial_person}, {transaction_text} {currency} {total_value_str} WORTH OF CO'S SHARES ON {date_text}-FINANSINSPEKTIONEN",
+    "closely_associated_volume": "{obligated_clean_name}, CLOSELY ASSOCIATED WITH {position_combined} {managerial_person}, {transaction_text} {volume} CO'S SHARES ON {date_text}-FINANSINSPEKTIONEN",
+    "place": "TRANSACTION PLACE: {transaction_place}",
+}
+
+def preview():
+    return {
+        "display_name": display_name,
+        "script_type": "stream",
+        "tags": [
+            {"name": "obligated_name", "tip": "name of the person with obligation to disclose", "detail": "{obligated_name}: e.g. 'Stefan Persson'"},
+            {"name": "obligated_clean_name", "tip": "name of the person or company with obligation to disclose, legal form removed", "detail": "{obligated_clean_name}: e.g. 'RAMSBURY INVEST'"},
+            {"name": "managerial_person", "tip": "person discharging managerial responsibilities", "detail": "{managerial_person}: e.g. 'STEFAN PERSSON'"},
+            {"name": "position", "tip": "position of obligated person", "detail": "{position}: e.g. 'CEO', 'CFO', 'Board Member'"},
+            {"name": "position_combined", "tip": "position together with the issuer", "detail": "{position_combined}: e.g. 'CEO OF MENDUS', 'CHAIRMAN OF H&M BOARD'"},
+            {"name": "issuer", "tip": "name of the issuer", "detail": "{issuer}: e.g. Mendus AB"},
+            {"name": "issuer_clean", "tip": "name of the issuer, legal form removed", "detail": "{issuer_clean}: e.g. MENDUS, H&M"},
+            {"name": "clean_instrument", "tip": "traded instrument name", "detail": "{clean_instrument}: e.g. Mendus, 'Common Stock (NYSE: ALV)'"},
+            {"name": "transaction", "tip": "transaction type as reported", "detail": "{transaction}: 'ACQUISITION' or 'DISPOSAL'"},
+            {"name": "transaction_text", "tip": "text of transaction type", "detail": "{transaction_text}: 'acquired' or 'disposed'"},
+            {"name": "volume", "tip": "number of instruments traded", "detail": "{volume}: e.g. 25000"},
+            {"name": "currency", "tip": "currency used in transaction", "detail": "{currency}: e.g. SEK, USD etc."},
+            {"name": "total_value", "tip": "total value in the trade currency as a number", "detail": "{total_value:,.0f}: e.g. 1,234,567"},
+            {"name": "total_value_str", "tip": "formatted total value", "detail": "{total_value_str}: e.g. '1.23 BLN', '12.3 MLN', '1,234', '123.45' etc."},
+            {"name": "total_value_base", "tip": "total value converted to SEK as a number", "detail": "{total_value_base:,.0f}: e.g. 12,345,678"},
+            {"name": "total_value_base_str", "tip": "formatted total value converted to SEK", "detail": "{total_value_base_str}: e.g. '12.3 MLN'"},
+            {"name": "base_currency", "tip": "currency of the converted values", "detail": "{base_currency}: SEK"},
+            {"name": "date_text", "tip": "date of transaction", "detail": "{date_text}: July 1st, December 24th"},
+            {"name": "transaction_date", "tip": "date of transaction as YYYY-MM-DD", "detail": "{transaction_date}: 2026-07-01"},
+            {"name": "transaction_place", "tip": "where transaction took place", "detail": "{transaction_place}: directly from the report, not formatted"},
+            {"name": "share_option", "tip": "transaction is part of a share option programme", "detail": "{share_option}: True or False, None in --fast_alerts alerts sent before the detail page"},
+        ],
+        "template_sentences": [
+            {"name": case, "template": template} for case, template in DEFAULT_TEMPLATES.items()
+        ],
+        "monitor": [f"{URL}"],
+        "fields": [
+            {"name": "threshold", "tip": "total value in SEK threshold for filtering, default set to SEK 500,000 (USD 50,000 for USD trades)"},
+            {"name": "fx_rates", "tip": "JSON file with SEK rates per currency, trades in other currencies are converted to SEK before the threshold check"},
+            {"name": "rules", "tip": "JSON file with filter rules per desk: thresholds per currency, issuer and person watchlists"},
+            {"name": "poll_interval", "tip": "polling interval in seconds, default set to 60 seconds"},
+            {"name": "min_interval", "tip": "shortest polling interval in seconds, used after new filings and in peak windows, default set to a quarter of poll_interval"},
+            {"name": "max_interval", "tip": "longest polling interval in seconds when quiet outside business hours or backing off from errors, default set to 600 seconds"},
+            {"name": "peak_windows", "tip": "HH:MM-HH:MM windows in Stockholm time polled at min_interval, default set to 07:55-09:15,17:25-18:30"},
+            {"name": "max_workers", "tip": "number of report pages fetched concurrently, default set to 4"},
+            {"name": "ordered", "tip": "emit alerts in publication order instead of as soon as each report is parsed"},
+            {"name": "incremental", "tip": "only read search results newer than the newest report of the previous poll"},
+            {"name": "pipeline", "tip": "run polling, report fetching, parsing and alerting as separate stages so slow reports never delay the next poll"},
+            {"name": "parse_workers", "tip": "processes parsing report pages in pipeline mode, 0 parses in threads, default set to the number of cores up to 4"},
+            {"name": "fast_alerts", "tip": "send alerts from the search table rows without waiting for the report page, an update event with the transaction place follows once the page is read"},
+            {"name": "backfill", "tip": "process every search page published between 'from' and 'to' (YYYY-MM-DD) once and exit"},
+            {"name": "profiles", "tip": "JSON file with named profiles sharing one fetch of every page: {\"profiles\": [{\"name\", \"threshold\", \"rules\" (rules file or list), \"output\" (list of outputs)}]}, profiles without an output use the output field"},
+            {"name": "templates", "tip": "JSON file with sentence templates per language, {\"en\": {\"insider_value\": ..., \"place\": ...}}, placeholders are the tags above"},
+            {"name": "language", "tip": "language of the templates to use, default set to en"},
+            {"name": "output", "tip": "where alerts are written as JSON lines: stdout, file:PATH, tcp:HOST:PORT, unix:PATH or webhook:URL"},
+            {"name": "output_buffer", "tip": "alerts buffered for the background output writer"},
+            {"name": "output_batch", "tip": "alerts written to an output in one batch"},
+            {"name": "metrics_port", "tip": "local port serving Prometheus metrics for the poll loop, disabled by default"},
+            {"name": "json_log", "tip": "write one JSON line per poll cycle to stderr"},
+            {"name": "seen_reports_db", "tip": "file where handled reports are kept between restarts, default set to seen_reports.db"},
+            {"name": "normalization", "tip": "JSON file with extra position titles, legal form suffixes and issuer display names such as H & M Hennes & Mauritz -> H&M"},
+            {"name": "history", "tip": "directory of the columnar store every parsed transaction is added to, queried with --query, 'off' to disable, default set to history"},
+            {"name": "detail_cache", "tip": "file caching report pages and parsed transactions so restarts and backfills skip the network, 'off' to disable, default set to detail_cache.db"},
+            {"name": "ha", "tip": "run as active/standby pair: file:DIRECTORY on shared storage or redis://HOST:PORT/PREFIX, only the instance holding the lease polls and the others take over with its seen reports"},
+            {"name": "ha_ttl", "tip": "seconds a lease lasts without renewal, default set to half the polling interval"},
+            {"name": "detail_cache_mb", "tip": "size limit of the detail cache in MB, default set to 256"},
+        ]
+    }
+
+def preview_json():
+    try:
+        with open(PREVIEW_FILE, 'r', encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return json.dumps(preview()) + "\n"
+
+if __name__ == "__main__":
+    with open(PREVIEW_FILE, 'w', encoding="utf-8") as f:
+        f.write(json.dumps(preview()) + "\n")
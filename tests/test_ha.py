@@ -0,0 +1,181 @@
+import http.server
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from finansinspektionen import monitor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+THRESHOLD = 1
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, f"{name}.html"), 'r', encoding="utf-8") as f:
+        return f.read()
+
+def takeover_page():
+    # search_200 renumbered as newer filings, listed above the search_50 rows the old leader handled
+    newer = fixture("search_200").replace("/Index/1", "/Index/5")
+    older = fixture("search_50")
+    older = older[older.index(monitor.RESULTS_TABLE_MARKER):]
+    end = newer.index("</tbody>", newer.index(monitor.RESULTS_TABLE_MARKER))
+    return newer[:end] + older[older.index("<tbody>") + len("<tbody>"): older.index("</tbody>")] + newer[end:]
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def run_instance(base_url, ha_dir, workdir, holder):
+    # One monitor process: polls the fixture server while it holds the lease, alerts go to alerts.ndjson
+    os.chdir(workdir)
+    monitor.SEARCH_URL = monitor.SEARCH_URL.replace(monitor.BASE_URL, base_url)
+    monitor.URL = monitor.URL.replace(monitor.BASE_URL, base_url)
+    monitor.BASE_URL = base_url
+    monitor.get_session().trust_env = False
+    monitor.seen_reports = monitor.SeenReportsStore("seen.db")
+    monitor.output = monitor.OutputWriter([monitor.make_sink("file:alerts.ndjson")]).start()
+    monitor.ha = monitor.HighAvailability(monitor.FileCoordinator(ha_dir, holder), ttl=1)
+    scheduler = monitor.PollScheduler(0.2, min_interval=0.2, max_interval=0.2, peak_windows="", business_hours="")
+    while True:
+        monitor.ha.wait_for_lease()
+        try:
+            monitor.run(THRESHOLD, 0.2, scheduler=scheduler, rules=monitor.default_rules(THRESHOLD))
+            return
+        except monitor.LeaseLost:
+            pass
+
+class FixtureServer:
+    # Serves self.search for the search page and the detail fixtures round robin by report index
+    def __init__(self, search):
+        self.search = search
+        details = [fixture(name) for name in ("detail_single", "detail_multi", "detail_share_option")]
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if "/Search/Search" in self.path:
+                    body = server.search
+                else:
+                    body = details[int(re.search(r"/Index/(\d+)", self.path)[1]) % len(details)]
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class FileCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_append_after_partial_line(self):
+        leader = monitor.FileCoordinator(self.directory, "a")
+        leader.read()
+        self.assertTrue(leader.acquire(1))
+        leader.append({"seen": [["r1", 1]]})
+        with open(leader.journal_path(0), 'a') as f:
+            f.write('{"seen": [["r2"') # the leader dies mid-write
+        leader.release()
+
+        successor = monitor.FileCoordinator(self.directory, "b")
+        self.assertEqual(successor.read(), (None, [{"seen": [["r1", 1]]}]))
+        self.assertTrue(successor.acquire(1))
+        successor.append({"seen": [["r3", 3]]})
+
+        standby = monitor.FileCoordinator(self.directory, "c")
+        self.assertEqual(standby.read()[1], [{"seen": [["r1", 1]]}, {"seen": [["r3", 3]]}])
+
+class TakeoverTest(unittest.TestCase):
+    # Two monitor processes share a file coordinator. The leader is killed right after it
+    # left a partial journal line behind, the standby takes over and must neither alert the
+    # leader's reports again nor lose the journal entries it writes itself.
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.ha_dir = os.path.join(self.directory, "ha")
+        self.server = FixtureServer(fixture("search_50"))
+        self.addCleanup(self.server.close)
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            process.kill()
+            process.join(5)
+
+    def start(self, holder):
+        workdir = os.path.join(self.directory, holder)
+        os.makedirs(workdir)
+        process = multiprocessing.get_context("spawn").Process(target=run_instance, args=(self.server.url, self.ha_dir, workdir, holder), daemon=True)
+        process.start()
+        self.processes.append(process)
+        return process
+
+    def alerts(self, holder):
+        try:
+            with open(os.path.join(self.directory, holder, "alerts.ndjson"), 'r', encoding="utf-8") as f:
+                return [json.loads(line)["report_url"] for line in f]
+        except FileNotFoundError:
+            return []
+
+    def journal(self):
+        try:
+            with open(os.path.join(self.ha_dir, "journal.0.jsonl"), 'r', encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def qualifying(self, page):
+        return list(monitor.filter_rows(monitor.extract_rows(page), monitor.default_rules(THRESHOLD)))
+
+    def test_takeover_after_crash_mid_write(self):
+        first_reports = self.qualifying(self.server.search)
+        leader = self.start("a")
+        self.assertTrue(wait_for(lambda: all(json.dumps(report) in self.journal() for report in first_reports)))
+        standby = self.start("b")
+        time.sleep(1) # standing by and catching up
+
+        with open(os.path.join(self.ha_dir, "journal.0.jsonl"), 'a') as f:
+            f.write('{"seen": [["/Publiceringsklient') # killed mid-write
+        leader.kill()
+        leader.join(5)
+        page = takeover_page()
+        self.server.search = page
+
+        reports = self.qualifying(page)
+        self.assertTrue(set(first_reports) & set(reports)) # the leader's reports are still listed
+        self.assertTrue(wait_for(lambda: all(json.dumps(report) in self.journal() for report in reports)))
+        self.assertTrue(standby.is_alive())
+
+        leader_alerts, standby_alerts = self.alerts("a"), self.alerts("b")
+        self.assertTrue(leader_alerts)
+        self.assertTrue(standby_alerts)
+        self.assertFalse(set(leader_alerts) & set(standby_alerts))
+        self.assertEqual(len(standby_alerts), len(set(standby_alerts)))
+
+        # a new standby reads every entry the new leader appended after the partial line
+        snapshot, entries = monitor.FileCoordinator(self.ha_dir, "c").read()
+        seen = {report for entry in entries for report, _ in entry.get("seen") or []}
+        self.assertTrue(set(reports) <= seen)
+
+if __name__ == "__main__":
+    unittest.main()
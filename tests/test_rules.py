@@ -0,0 +1,179 @@
+import random
+import re
+import unittest
+
+from finansinspektionen import monitor
+
+def row(issuer="Acme AB", person="Anna Svensson", closely="", transaction="Acquisition", instrument_type="Share", currency="SEK"):
+    cells = [""] * 16
+    cells[1] = issuer
+    cells[2] = person
+    cells[4] = closely
+    cells[5] = transaction
+    cells[7] = instrument_type
+    cells[13] = currency
+    return cells
+
+def reference_match(rules, cells, total_value, base_value):
+    # Straightforward rule by rule evaluation the bitmask matcher has to agree with
+    for i, rule in enumerate(rules):
+        if rule.get("instrument_types") is not None and cells[7] not in rule["instrument_types"]:
+            continue
+        if rule.get("transactions") is not None and cells[5] not in rule["transactions"]:
+            continue
+        if rule.get("currencies") is not None and cells[13] not in rule["currencies"]:
+            continue
+        mode = rule.get("closely_associated", "exclude")
+        if cells[4] == "":
+            if mode == "only":
+                continue
+        elif mode == "exclude":
+            surnames = {surname.casefold() for surname in rule.get("closely_associated_surnames") or []}
+            if not {name.casefold() for name in cells[2].split(" ")[-2:]} & surnames:
+                continue
+        override = (rule.get("currency_min_values") or {}).get(cells[13])
+        if override is not None:
+            if not total_value > override:
+                continue
+        elif not base_value > rule.get("min_value", 0):
+            continue
+        if not name_matches(rule, "issuers", "issuer_pattern", cells[1]):
+            continue
+        if not name_matches(rule, "persons", "person_pattern", cells[2]):
+            continue
+        return rule.get("name") or f"rule {i + 1}"
+    return None
+
+def name_matches(rule, names_key, pattern_key, name):
+    if rule.get(names_key) is None and rule.get(pattern_key) is None:
+        return True
+    if name.casefold() in {n.casefold() for n in rule.get(names_key) or []}:
+        return True
+    return bool(rule.get(pattern_key)) and re.search(rule[pattern_key], name, re.IGNORECASE) is not None
+
+class DefaultRuleTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = monitor.default_rules(1_000_000)
+
+    def test_threshold_is_exclusive(self):
+        self.assertIsNone(self.rules.match(row(), 1_000_000))
+        self.assertEqual(self.rules.match(row(), 1_000_001), "default")
+
+    def test_base_value_is_compared_with_min_value(self):
+        self.assertEqual(self.rules.match(row(currency="EUR"), 200_000, 2_000_000), "default")
+        self.assertIsNone(self.rules.match(row(currency="EUR"), 2_000_000, 200_000))
+
+    def test_usd_override_uses_the_traded_value(self):
+        self.assertEqual(self.rules.match(row(currency="USD"), 50_001, 500_000), "default")
+        self.assertIsNone(self.rules.match(row(currency="USD"), 50_000, 5_000_000))
+
+    def test_instrument_type_and_transaction(self):
+        self.assertIsNone(self.rules.match(row(instrument_type="Option"), 5_000_000))
+        self.assertIsNone(self.rules.match(row(transaction="Subscription"), 5_000_000))
+        self.assertEqual(self.rules.match(row(transaction="Disposal"), 5_000_000), "default")
+
+    def test_closely_associated_surnames(self):
+        self.assertIsNone(self.rules.match(row(closely="Yes"), 5_000_000))
+        self.assertIsNone(self.rules.match(row(closely="x"), 5_000_000)) # any value counts
+        self.assertEqual(self.rules.match(row(person="Lennart Arnhult", closely="Yes"), 5_000_000), "default")
+        self.assertEqual(self.rules.match(row(person="Stefan Persson Holding", closely="Yes"), 5_000_000), "default")
+        self.assertEqual(self.rules.match(row(person="erik persson", closely="Yes"), 5_000_000), "default")
+        self.assertIsNone(self.rules.match(row(person="Persson Anders Karlsson", closely="Yes"), 5_000_000))
+
+class RuleMatcherTest(unittest.TestCase):
+    def test_first_matching_rule_in_file_order(self):
+        rules = monitor.build_rules([
+            {"name": "large", "min_value": 10_000_000},
+            {"name": "any", "min_value": 0},
+            {"name": "medium", "min_value": 1_000_000},
+        ], 0)
+        self.assertEqual(rules.match(row(), 20_000_000), "large")
+        self.assertEqual(rules.match(row(), 5_000_000), "any")
+        self.assertIsNone(rules.match(row(), 0))
+
+    def test_missing_min_value_uses_threshold(self):
+        rules = monitor.build_rules([{"name": "a"}], 100)
+        self.assertIsNone(rules.match(row(), 100))
+        self.assertEqual(rules.match(row(), 101), "a")
+
+    def test_unnamed_rules(self):
+        rules = monitor.build_rules([{"issuers": ["Other AB"]}, {}], 0)
+        self.assertEqual(rules.match(row(), 1), "rule 2")
+
+    def test_closely_associated_modes(self):
+        rules = monitor.build_rules([{"name": "only", "closely_associated": "only"}, {"name": "include", "closely_associated": "include"}], 0)
+        self.assertEqual(rules.match(row(closely="Yes"), 1), "only")
+        self.assertEqual(rules.match(row(), 1), "include")
+        with self.assertRaises(ValueError):
+            monitor.build_rules([{"closely_associated": "sometimes"}], 0)
+
+    def test_issuer_and_person_names_and_patterns(self):
+        rules = monitor.build_rules([
+            {"name": "issuer", "issuers": ["ACME AB"]},
+            {"name": "issuer pattern", "issuer_pattern": "^Volvo"},
+            {"name": "person", "persons": ["Anna Svensson"], "issuer_pattern": "Bank"},
+            {"name": "person pattern", "person_pattern": "son$"},
+        ], 0)
+        self.assertEqual(rules.match(row(issuer="Acme AB"), 1), "issuer")
+        self.assertEqual(rules.match(row(issuer="volvo car AB"), 1), "issuer pattern")
+        self.assertEqual(rules.match(row(issuer="Nordea Bank Abp"), 1), "person")
+        self.assertEqual(rules.match(row(issuer="Ericsson AB"), 1), "person pattern")
+        self.assertIsNone(rules.match(row(issuer="Ericsson AB", person="Bo Berg"), 1))
+
+    def test_unknown_keys_are_rejected(self):
+        with self.assertRaises(ValueError):
+            monitor.build_rules([{"name": "a", "min_vaule": 1}], 0)
+
+    def test_more_than_64_rules(self):
+        rules = monitor.build_rules([{"name": f"r{i}", "issuers": [f"Issuer {i}"], "min_value": i * 10} for i in range(100)], 0)
+        self.assertEqual(rules.match(row(issuer="Issuer 99"), 991), "r99")
+        self.assertIsNone(rules.match(row(issuer="Issuer 99"), 990))
+        self.assertEqual(rules.match(row(issuer="Issuer 70"), 701), "r70")
+
+    def test_agrees_with_reference(self):
+        generator = random.Random(8)
+        issuers = ["Acme AB", "Volvo AB", "Nordea Bank Abp", "Ericsson AB"]
+        persons = ["Anna Svensson", "Lennart Arnhult", "Erik Persson", "Bo Berg"]
+        currencies = ["SEK", "EUR", "USD", "NOK"]
+        thresholds = [0, 10_000, 50_000, 100_000, 1_000_000]
+
+        def some(values):
+            return generator.sample(values, generator.randint(1, len(values))) if generator.random() < 0.5 else None
+
+        for _ in range(20):
+            rules = []
+            for i in range(generator.randint(1, 80)):
+                rule = {
+                    "name": f"r{i}",
+                    "instrument_types": some(["Share", "Option", "Warrant"]),
+                    "transactions": some(["Acquisition", "Disposal", "Subscription"]),
+                    "currencies": some(currencies),
+                    "issuers": some(issuers),
+                    "persons": some(persons),
+                    "closely_associated": generator.choice(["exclude", "include", "only"]),
+                    "closely_associated_surnames": some(["Arnhult", "Persson"]),
+                    "min_value": generator.choice(thresholds),
+                }
+                if generator.random() < 0.3:
+                    rule["currency_min_values"] = {generator.choice(currencies): generator.choice(thresholds)}
+                if generator.random() < 0.2:
+                    rule["issuer_pattern"] = generator.choice(["AB$", "^Nordea", "bank"])
+                if generator.random() < 0.2:
+                    rule["person_pattern"] = generator.choice(["son$", "^Bo "])
+                rules.append({key: value for key, value in rule.items() if value is not None})
+            matcher = monitor.build_rules(rules, 0)
+            for _ in range(200):
+                cells = row(
+                    issuer=generator.choice(issuers),
+                    person=generator.choice(persons),
+                    closely=generator.choice(["", "Yes"]),
+                    transaction=generator.choice(["Acquisition", "Disposal", "Subscription"]),
+                    instrument_type=generator.choice(["Share", "Option", "Warrant"]),
+                    currency=generator.choice(currencies),
+                )
+                total_value = generator.choice(thresholds + [generator.uniform(0, 2_000_000)])
+                base_value = generator.choice([total_value, total_value * 10, total_value / 10])
+                self.assertEqual(matcher.match(cells, total_value, base_value), reference_match(rules, cells, total_value, base_value), (rules, cells, total_value, base_value))
+
+if __name__ == "__main__":
+    unittest.main()